@@ -0,0 +1,463 @@
+import numpy as np
+from scipy import linalg, sparse
+
+
+def element_stiffness(EI, L):
+    ''' Fixed-fixed Euler-Bernoulli stiffness of every member, shape (members, 4, 4)'''
+    EI = np.asarray(EI, dtype=float)
+    L = np.asarray(L, dtype=float)
+    kfv = 12 * EI / L**3
+    kmv = 6 * EI / L**2
+    kmt = 4 * EI / L
+    kmth = 2 * EI / L
+    return np.stack([
+        np.stack([kfv, kmv, -kfv, kmv], axis=-1),
+        np.stack([kmv, kmt, -kmv, kmth], axis=-1),
+        np.stack([-kfv, -kmv, kfv, -kmv], axis=-1),
+        np.stack([kmv, kmth, -kmv, kmt], axis=-1),
+    ], axis=-2)
+
+
+def point_load_cnl(P, a, L):
+    ''' Consistent nodal loads (Va, Ma, Vb, Mb) of point loads on fixed-fixed members'''
+    b = np.maximum(L - a, 0)
+    return np.stack([
+        P / L**3 * (b * L**2 - a**2 * b + a * b**2),
+        P * a * b**2 / L**2,
+        P / L**3 * (a * L**2 + a**2 * b - a * b**2),
+        -P * a**2 * b / L**2,
+    ])
+
+
+def partial_udl_cnl(w, a, c, L):
+    ''' Consistent nodal loads (Va, Ma, Vb, Mb) of partial UDLs on fixed-fixed
+    members, elementwise over arrays'''
+    w, a, c, L = np.broadcast_arrays(*(np.asarray(v, dtype=float) for v in (w, a, c, L)))
+    on = a <= L
+    c = np.minimum(c, L - a)
+    s = a + c / 2
+    t = L - s
+    Va = (w * c / L**3) * ((2 * s + L) * t**2 + (s - t) * c**2 / 4)
+    return np.where(on, np.stack([
+        Va,
+        (w * c / L**2) * (s * t**2 + (s - 2 * t) * c**2 / 12),
+        w * c - Va,
+        -(w * c / L**2) * (t * s**2 + (t - 2 * s) * c**2 / 12),
+    ]), 0.)
+
+
+def load_matrix(LM):
+    ''' pycba-style load matrix (rows of [span, type, value, a, c], shorter
+    rows allowed) as a contiguous (loads, 5) float array'''
+    if isinstance(LM, np.ndarray):
+        return np.ascontiguousarray(LM, dtype=float).reshape(-1, 5)
+    table = np.zeros((len(LM), 5))
+    for i, row in enumerate(LM):
+        table[i, :len(row)] = row[:5]
+    return table
+
+
+def locate(nodes, positions):
+    ''' (0-based span, position in span) of an array of positions on a beam
+    with the given node positions, span -1 off the beam'''
+    positions = np.asarray(positions, dtype=float)
+    no_spans = len(nodes) - 1
+    span = np.minimum(np.searchsorted(nodes, positions, side="right") - 1, no_spans - 1)
+    span = np.where((positions < 0) | (positions > nodes[-1]), -1, span)
+    return span, positions - nodes[np.maximum(span, 0)]
+
+
+def statically_determinate(R):
+    ''' True when the restraints R (pycba's layout) give a beam exactly the
+    two reactions statics can find, so its moments, shears and reactions do
+    not depend on EI'''
+    R = np.asarray(R)
+    return np.count_nonzero(R < 0) == 2 and not np.any(R > 0)
+
+
+class StationResults:
+    ''' Moment and shear at the output stations of every member, concatenated'''
+    def __init__(self, x, M, V):
+        self.x = x
+        self.M = M
+        self.V = V
+
+
+class BandedResults:
+    ''' Results of a single load case, laid out like pycba's BeamResults'''
+    def __init__(self, x, M, V, R, D):
+        self.results = StationResults(x, M, V)
+        self.R = R
+        self.D = D
+
+
+class LoadCases:
+    ''' Point-load cases solved together by BandedBeamAnalysis.solve_cases.
+    P and the global load positions are shaped (loads, cases), M and V
+    (stations, cases), R holds the reactions and D the nodal displacements,
+    which set_member_ei and move_nodes correct when the beam changes.'''
+    def __init__(self, P, positions, npts, x, M, V, R, D):
+        self.P = P
+        self.positions = positions
+        self.npts = npts
+        self.x = x
+        self.M = M
+        self.V = V
+        self.R = R
+        self.D = D
+
+
+class BandedBeamAnalysis:
+    ''' Continuous beam solved with a banded Cholesky factorization of the
+    free-DOF stiffness. Takes the same L, EI, R and LM as pycba's BeamAnalysis
+    and returns results at the same stations, so BeamModel can use either.
+    solve_point_loads analyzes many load cases (e.g. every train position) as
+    one multi-right-hand-side solve: the factorization is done once and each
+    case costs a pair of triangular back-substitutions. solves counts the
+    load cases solved by every instance.'''
+    STABILITY_RCOND = 1e-12
+    solves = 0
+
+    def __init__(self, L, EI, R, LM=None):
+        self.L = np.array(L, dtype=float)
+        self.EI = np.array(np.broadcast_to(np.asarray(EI, dtype=float), self.L.shape))
+        self.restraints = np.asarray(R, dtype=float)
+        self.no_spans = len(self.L)
+        self.n_dof = 2 * (self.no_spans + 1)
+        if len(self.restraints) != self.n_dof:
+            raise ValueError(f"R needs {self.n_dof} entries for {self.no_spans} spans.")
+        self.fixed = self.restraints < 0
+        self.free = np.flatnonzero(~self.fixed)
+        self._assemble()
+
+        self.npts = 100
+        self.LM = LM if LM is not None else []
+        self.beam_results = None
+
+    def _assemble(self):
+        ''' Stiffness and banded factorization of the current L and EI'''
+        self.nodes = np.concatenate([[0.], np.cumsum(self.L)])
+        self.length = self.nodes[-1]
+        self.k = element_stiffness(self.EI, self.L)
+        dofs = 2 * np.arange(self.no_spans)[:, None] + np.arange(4)
+        rows = np.broadcast_to(dofs[:, :, None], self.k.shape)
+        cols = np.broadcast_to(dofs[:, None, :], self.k.shape)
+        K = sparse.coo_matrix((self.k.ravel(), (rows.ravel(), cols.ravel())),
+                              shape=(self.n_dof, self.n_dof)).tocsr()
+        springs = np.maximum(self.restraints, 0)
+        self.K = K + sparse.diags(springs)
+
+        # Upper banded storage of the free-DOF stiffness. Each member couples
+        # four consecutive DOFs, so the half-bandwidth is at most 3.
+        Kff = self.K[self.free][:, self.free].tocoo()
+        upper = Kff.row <= Kff.col
+        self.bandwidth = max(3, int((Kff.col - Kff.row).max(initial=0)))
+        ab = np.zeros((self.bandwidth + 1, len(self.free)))
+        ab[self.bandwidth + Kff.row[upper] - Kff.col[upper], Kff.col[upper]] = Kff.data[upper]
+        # A mechanism either breaks the factorization or leaves a pivot that
+        # is only rounding noise relative to the others
+        try:
+            self.factor = linalg.cholesky_banded(ab)
+            pivots = self.factor[-1]**2
+            stable = pivots.min() > self.STABILITY_RCOND * pivots.max()
+        except linalg.LinAlgError:
+            stable = False
+        if not stable:
+            raise ValueError(
+                "Structure is geometrically unstable: the stiffness matrix is "
+                "singular. Check that sufficient support restraints are defined."
+            )
+
+    @property
+    def beam(self):
+        # BeamModel reaches the geometry through beam_analysis.beam, as with pycba
+        return self
+
+    def get_local_span_coords(self, pos):
+        ''' (0-based span, position in span) of a global position, or (-1, 0) off the beam'''
+        if pos < 0 or pos > self.length:
+            return -1, 0
+        span = min(int(np.searchsorted(self.nodes, pos, side="right")) - 1, self.no_spans - 1)
+        return span, pos - self.nodes[span]
+
+    def locate(self, positions):
+        ''' Vectorized get_local_span_coords'''
+        return locate(self.nodes, positions)
+
+    def stations(self, npts):
+        ''' Member-local output stations, padded with duplicated end stations as pycba does'''
+        dx = self.L / npts
+        xr = dx[:, None] * np.arange(npts + 1)
+        return np.concatenate([xr[:, :1], xr, xr[:, -1:]], axis=1)
+
+    def set_loads(self, LM):
+        self.LM = LM
+
+    def analyze(self, npts=None):
+        if npts and npts > 3:
+            self.npts = npts
+        LM = load_matrix(self.LM)
+        kind = LM[:, 1]
+        if not np.isin(kind, (0, 1, 2, 3)).all():
+            raise ValueError("The banded backend supports UDL, point and partial UDL loads only.")
+        point = LM[kind == 2]
+        P = point[:, 2:3]
+        span = point[:, 0:1].astype(int) - 1
+        a = point[:, 3:4]
+
+        # distributed loads: type 1 is a full UDL, type 3 a partial one
+        rows = LM[(kind == 1) | (kind == 3)]
+        full = rows[:, 1] == 1
+        udls = np.column_stack([rows[:, 0] - 1, rows[:, 2], np.where(full, 0., rows[:, 3]),
+                                np.where(full, np.inf, rows[:, 4])])
+
+        x, M, V, R, D = self.solve_point_loads(P, span, a, self.npts, udls)
+        self.beam_results = BandedResults(x, M[:, 0], V[:, 0], R[:, 0], D[:, 0])
+        return 0
+
+    def solve_point_loads(self, P, span, a, npts=None, udls=(), chunk=256, members=None):
+        ''' Load effects of many load cases of point loads. P, span (0-based,
+        -1 for loads off the beam) and a (position in span) are shaped
+        (loads, cases). udls, rows of (span, w, a, c), apply to every case.
+        Returns (x, M, V, R, D) with M and V shaped (stations, cases), R the
+        reactions at the restrained DOFs and D the nodal displacements.
+        M and V only cover the stations of members if given.'''
+        npts = npts or self.npts
+        P, span, a = self._on_beam(P, span, a)
+        n_cases = P.shape[1]
+        members = np.arange(self.no_spans) if members is None else np.asarray(members)
+        ref = self._fixed_end_forces(P, span, a, udls)
+        D = self._displacements(ref)
+        R = self._reactions(D, ref)
+        M, V = self._station_effects(self._end_forces(D, ref), P, span, a, npts, udls,
+                                     members, chunk)
+        xg = (self.stations(npts)[members] + self.nodes[members, None]).ravel()
+        return xg, M.reshape(-1, n_cases), V.reshape(-1, n_cases), R, D
+
+    def solve_cases(self, P, positions, npts=None):
+        ''' LoadCases of point loads P at global positions, both shaped
+        (loads, cases), which set_member_ei and move_nodes keep up to date'''
+        positions = np.atleast_2d(np.asarray(positions, dtype=float))
+        P = np.broadcast_to(np.asarray(P, dtype=float), positions.shape)
+        npts = npts or self.npts
+        span, at = self.locate(positions)
+        x, M, V, R, D = self.solve_point_loads(P, span, at, npts)
+        return LoadCases(P, positions, npts, x, M, V, R, D)
+
+    @staticmethod
+    def _on_beam(P, span, a):
+        # loads off the beam (span -1) become zero loads on the first span
+        P = np.atleast_2d(np.asarray(P, dtype=float))
+        span = np.atleast_2d(np.asarray(span))
+        a = np.atleast_2d(np.asarray(a, dtype=float))
+        P, span, a = np.broadcast_arrays(P, span, a)
+        on = span >= 0
+        return np.where(on, P, 0.), np.where(on, span, 0), np.where(on, a, 0.)
+
+    def _fixed_end_forces(self, P, span, a, udls=()):
+        ''' Fixed-end forces of the loads on every member, (members, 4, cases)'''
+        n_cases = P.shape[1]
+        ref = np.zeros((self.no_spans, 4, n_cases))
+        cases = np.broadcast_to(np.arange(n_cases), P.shape)
+        cnl = point_load_cnl(P, a, self.L[span])
+        for j in range(4):
+            np.add.at(ref[:, j], (span, cases), cnl[j])
+        udls = np.asarray(udls, dtype=float).reshape(-1, 4)
+        if len(udls):
+            member = udls[:, 0].astype(int)
+            static = np.zeros((self.no_spans, 4))
+            np.add.at(static, member, partial_udl_cnl(udls[:, 1], udls[:, 2], udls[:, 3],
+                                                      self.L[member]).T)
+            ref += static[:, :, None]
+        return ref
+
+    def _assembled(self, f):
+        ''' Member end quantities (members, 4, cases) summed into DOFs'''
+        n_cases = f.shape[-1]
+        F = np.zeros((self.n_dof, n_cases))
+        F[:-2] += f[:, :2].reshape(-1, n_cases)
+        F[2:] += f[:, 2:].reshape(-1, n_cases)
+        return F
+
+    def _displacements(self, ref):
+        D = np.zeros((self.n_dof, ref.shape[-1]))
+        D[self.free] = linalg.cho_solve_banded((self.factor, False), -self._assembled(ref)[self.free])
+        BandedBeamAnalysis.solves += ref.shape[-1]
+        return D
+
+    def _reactions(self, D, ref):
+        return (self.K @ D + self._assembled(ref))[self.fixed]
+
+    def _end_forces(self, D, ref):
+        dofs = 2 * np.arange(self.no_spans)[:, None] + np.arange(4)
+        return np.einsum("mij,mjc->mic", self.k, D[dofs]) + ref
+
+    def _station_effects(self, f, P, span, a, npts, udls=(), members=None, chunk=256):
+        ''' M and V at the stations of members (every member by default),
+        shaped (members, stations, cases), from the member end forces f'''
+        members = np.arange(self.no_spans) if members is None else np.asarray(members)
+        n_cases = P.shape[1]
+        x = self.stations(npts)[members]
+
+        # member end moments give the indeterminate part of M and V along each member
+        Ma, Mb = f[members, 1], f[members, 3]
+        Va = (Ma + Mb) / self.L[members, None]
+        M = Va[:, None, :] * x[:, :, None] - Ma[:, None, :]
+        V = np.repeat(Va[:, None, :], x.shape[1], axis=1)
+
+        # plus the simply supported response to the loads on each member
+        udls = np.asarray(udls, dtype=float).reshape(-1, 4)
+        for i, member in enumerate(members):
+            xm = x[i][:, None, None]
+            Lm = self.L[member]
+            # only the load rows that reach this member in some case
+            rows = np.flatnonzero((span == member).any(axis=1))
+            for lo in range(0, n_cases, chunk):
+                sl = slice(lo, lo + chunk)
+                Pm = np.where(span[rows, sl] == member, P[rows, sl], 0.)
+                am = a[rows, sl]
+                Vs = Pm * np.maximum(Lm - am, 0) / Lm
+                M[i, :, sl] += (Vs * xm - Pm * np.maximum(xm - am, 0)).sum(axis=1)
+                V[i, :, sl] += (Vs - Pm * np.heaviside(xm - am, 0)).sum(axis=1)
+            on = udls[udls[:, 0] == member]
+            if len(on):
+                Mu, Vu = self._udl_effects(x[i][:, None], on[:, 1], on[:, 2], on[:, 3], Lm)
+                M[i] += Mu.sum(axis=1)[:, None]
+                V[i] += Vu.sum(axis=1)[:, None]
+
+        M[:, [0, -1]] = 0.
+        V[:, [0, -1]] = 0.
+        return M, V
+
+    def set_member_ei(self, member, EI, cases=()):
+        ''' Change the EI of one member in place, correcting each of the
+        LoadCases in cases instead of solving them again'''
+        dofs = 2 * member + np.arange(4)
+        dK = element_stiffness(EI - self.EI[member], self.L[member])
+        updated = self._woodbury(dofs, dK, cases)
+        self.EI[member] = EI
+        self._assemble()
+        for case, (D, f) in zip(cases, updated):
+            self._refresh(case, D, f, moved=())
+
+    def move_nodes(self, nodes, positions, cases=()):
+        ''' Move interior nodes (1 to no_spans - 1) to new global positions in
+        place, keeping their order, and correct each of the LoadCases in cases.
+        Only the members next to a moved node need their stations solved again.'''
+        nodes = np.atleast_1d(nodes)
+        new = self.nodes.copy()
+        new[nodes] = positions
+        if np.any((nodes < 1) | (nodes >= self.no_spans)) or np.any(np.diff(new) <= 0):
+            raise ValueError("Only interior nodes can move, and not past their neighbours.")
+        L = np.diff(new)
+        # a member between two moved nodes keeps its length but not its loads
+        shifted = new != self.nodes
+        moved = np.flatnonzero(shifted[:-1] | shifted[1:])
+
+        dofs = np.unique(2 * moved[:, None] + np.arange(4))
+        dK = np.zeros((len(dofs), len(dofs)))
+        k = element_stiffness(self.EI[moved], L[moved]) - self.k[moved]
+        local = np.searchsorted(dofs, 2 * moved[:, None] + np.arange(4))
+        np.add.at(dK, (local[:, :, None], local[:, None, :]), k)
+        # cases with a load on a moved member get new fixed-end forces and are
+        # solved again; the others are corrected
+        touched = [np.isin(self.locate(case.positions)[0], moved).any(axis=0) for case in cases]
+        updated = self._woodbury(dofs, dK, cases)
+
+        self.L = L
+        self._assemble()
+        for case, (D, f), old in zip(cases, updated, touched):
+            self._refresh(case, D, f, moved, old)
+
+    def _woodbury(self, dofs, dK, cases):
+        ''' (displacements after the stiffness change dK on dofs, end forces
+        before it) of each case. With U the unit columns of dofs,
+        (K + U dK U^T)^-1 = K^-1 - Z (I + dK U^T Z)^-1 dK U^T K^-1 and
+        Z = K^-1 U, so the old factorization serves every case with
+        len(dofs) extra back-substitutions.'''
+        keep = ~self.fixed[dofs]
+        dofs, dK = dofs[keep], dK[np.ix_(keep, keep)]
+        U = np.zeros((self.n_dof, len(dofs)))
+        U[dofs, np.arange(len(dofs))] = 1.
+        Z = np.zeros_like(U)
+        Z[self.free] = linalg.cho_solve_banded((self.factor, False), U[self.free])
+        BandedBeamAnalysis.solves += len(dofs)
+        capacitance = np.eye(len(dofs)) + dK @ Z[dofs]
+
+        updated = []
+        for case in cases:
+            P, span, a = self._on_beam(case.P, *self.locate(case.positions))
+            f = self._end_forces(case.D, self._fixed_end_forces(P, span, a))
+            D = case.D - Z @ np.linalg.solve(capacitance, dK @ case.D[dofs])
+            updated.append((D, f))
+        return updated
+
+    def _refresh(self, case, D, f_old, moved, touched=None):
+        ''' Bring a LoadCases up to date with the changed beam, from its
+        corrected displacements D and its end forces f_old before the change'''
+        P, span, a = self._on_beam(case.P, *self.locate(case.positions))
+        ref = self._fixed_end_forces(P, span, a)
+        if len(moved):
+            touched = touched | np.isin(span, moved).any(axis=0)
+            D[:, touched] = self._displacements(ref[:, :, touched])
+        f = self._end_forces(D, ref)
+
+        # members away from the change carry the same loads, so their M and V
+        # only change with their end moments; on a statically determinate
+        # beam those do not change at all
+        n_cases = D.shape[1]
+        M = case.M.reshape(self.no_spans, -1, n_cases)
+        V = case.V.reshape(self.no_spans, -1, n_cases)
+        x = self.stations(case.npts)
+        df = f - f_old
+        tol = 1e-10 * np.abs(f).max(initial=0.)
+        for member in np.setdiff1d(np.arange(self.no_spans), moved):
+            if np.abs(df[member]).max() <= tol:
+                continue
+            dVa = (df[member, 1] + df[member, 3]) / self.L[member]
+            M[member, 1:-1] += dVa * x[member, 1:-1, None] - df[member, 1]
+            V[member, 1:-1] += dVa
+        if len(moved):
+            M[moved], V[moved] = self._station_effects(f, P, span, a, case.npts, members=moved)
+            case.x = (x + self.nodes[:-1, None]).ravel()
+        case.D = D
+        case.R = self._reactions(D, ref)
+
+    def ei_sensitivities(self, D, npts=None):
+        ''' dM/dEI and dV/dEI at every station, shaped (stations, members), for
+        the load case with nodal displacements D (a column of solve_point_loads).
+        The member stiffness is linear in EI, so K dD/dEI_j = -(k_j / EI_j) d_j
+        gives the displacement change of every member in one multi-right-hand-
+        side solve; the loads do not depend on EI.'''
+        npts = npts or self.npts
+        D = np.asarray(D, dtype=float).reshape(-1)
+        members = np.arange(self.no_spans)
+        dofs = 2 * members[:, None] + np.arange(4)
+        kd = np.einsum("mij,mj->mi", self.k, D[dofs]) / self.EI[:, None]
+
+        rhs = np.zeros((self.n_dof, self.no_spans))
+        np.add.at(rhs, (dofs, members[:, None]), -kd)
+        dD = np.zeros_like(rhs)
+        dD[self.free] = linalg.cho_solve_banded((self.factor, False), rhs[self.free])
+
+        # end force changes of member m for a change of EI_j, (m, 4, j)
+        df = np.einsum("mik,mkj->mij", self.k, dD[dofs])
+        df[members, :, members] += kd
+        dMa, dMb = df[:, 1], df[:, 3]
+        dVa = (dMa + dMb) / self.L[:, None]
+        x = self.stations(npts)
+        dM = dVa[:, None, :] * x[:, :, None] - dMa[:, None, :]
+        dV = np.repeat(dVa[:, None, :], x.shape[1], axis=1)
+        dM[:, [0, -1]] = 0.
+        dV[:, [0, -1]] = 0.
+        return dM.reshape(-1, self.no_spans), dV.reshape(-1, self.no_spans)
+
+    @staticmethod
+    def _udl_effects(x, w, a, c, L):
+        ''' Simply supported M and V of partial UDLs (pycba's LoadPUDL), elementwise'''
+        c = np.minimum(c, L - a)
+        b = a + c
+        Va = (L - b + c / 2) * c * w / L
+        M = Va * x - (w / 2) * np.maximum(x - a, 0)**2 + (w / 2) * np.maximum(x - b, 0)**2
+        V = Va - w * np.maximum(x - a, 0) + w * np.maximum(x - b, 0)
+        return M, V
@@ -0,0 +1,261 @@
+''' Offline benchmarks of the train analyses, failure loads and design sweeps.
+
+    python benchmark.py -o baseline.json
+    python benchmark.py --compare baseline.json
+
+Each case is run once under tracemalloc for its peak memory and then timed
+repeat times without it; the best time is kept. --compare flags every case
+that got slower than the baseline by more than --tolerance and exits with
+status 1 if any did, so it can gate a commit. No files outside the output
+and a temporary envelope cache are written, and nothing is downloaded.
+
+The scaling cases check a continuous bridge of more and more spans; run
+reports the log-log slope of their wall time and peak memory against the
+number of spans, which stays near 1 while the work grows linearly.'''
+import argparse
+import copy
+import json
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+from datetime import datetime, timezone
+
+import numpy as np
+
+from beam_functions import solve_count
+from combination import (analyze_fos_nonuniform, build_beam, find_failure_load, fos_report,
+                         nonuniform_params, optimize_split, uniform_params)
+from sweep import sweep
+
+
+GEOMETRIES = {"1-span": uniform_params, "3-span": nonuniform_params}
+
+# (method, backend) of the train runs; the pycba scan is the reference
+TRAIN_METHODS = (("scan", "pycba"), ("scan", "banded"), ("influence", "banded"), ("critical", "pycba"))
+
+STEPS = {"1mm": 1., "coarse": 10.}
+
+SWEEP_SIZES = (10, 100)
+FULL_SWEEP_SIZES = (10, 100, 1000, 10000)
+
+# spans of the continuous bridges in the scaling cases, checked with a
+# windowed banded scan (BeamModel.window) at the coarse step
+SCALING_SPANS = (10, 20, 40, 80)
+FULL_SCALING_SPANS = (10, 20, 40, 80, 160, 320)
+SCALING_WINDOW = 4
+
+
+def _train_case(params, method, backend, step):
+    def run():
+        beam = build_beam(params)
+        beam.method, beam.backend, beam.step = method, backend, step
+        beam.analyze_train(100)
+    return run
+
+
+def _bisection_case(params):
+    # the non-linear path: a train run per load tried, on the fast backend
+    def run():
+        beam = build_beam(params)
+        beam.linear = False
+        beam.method, beam.backend = "influence", "banded"
+        find_failure_load(params, beam)
+    return run
+
+
+def _sweep_case(params, n_designs, processes):
+    # every design has its own split: the bridge is statically determinate,
+    # so designs that only change a section reuse the envelope of their split
+    splits = np.linspace(100, 400, n_designs).tolist()
+
+    def run():
+        with tempfile.TemporaryDirectory() as cache_dir:
+            sweep(params, {"split": splits}, processes=processes, cache_dir=cache_dir)
+    return run, len(splits)
+
+
+def continuous_params(n_spans, span=1200.):
+    ''' nonuniform_params on a continuous bridge of n_spans spans on rollers,
+    the spans alternating between its two sections with lengths varying by
+    up to 20 %'''
+    params = copy.deepcopy(nonuniform_params)
+    section = np.arange(n_spans) % 2
+    for key, value in params.items():
+        if key != "L" and np.ndim(value):
+            # the first two entries are the support-span and central-span values
+            params[key] = np.asarray(value)[:2][section]
+    params["L"] = (span * (1 + 0.1 * (np.arange(n_spans) % 3))).tolist()
+    params["supports"] = ["roller"] * n_spans
+    params.update(method="scan", backend="banded", window=SCALING_WINDOW)
+    return params
+
+
+def _scaling_case(n_spans):
+    params = continuous_params(n_spans)
+
+    def run():
+        beam = build_beam(params)
+        beam.step = STEPS["coarse"]
+        fos_report(params, beam=beam)
+    return run
+
+
+def scaling_exponents(results):
+    ''' Log-log slopes of the wall time and peak memory of the scaling cases
+    against their number of spans, or None with fewer than two of them'''
+    measured = {int(name.split("/")[1].split("-")[0]): r for name, r in results.items()
+                if name.startswith("scaling/")}
+    if len(measured) < 2:
+        return None
+    spans = np.log(sorted(measured))
+    return {key: np.polyfit(spans, np.log([measured[n][key] for n in sorted(measured)]), 1)[0]
+            for key in ("wall_s", "peak_mib")}
+
+
+def cases(sweep_sizes=SWEEP_SIZES, processes=1, scaling_spans=SCALING_SPANS):
+    ''' {name: (function, designs per call)}'''
+    suite = {}
+    for geometry, params in GEOMETRIES.items():
+        for step_name, step in STEPS.items():
+            for method, backend in TRAIN_METHODS:
+                name = f"analyze_train/{geometry}/{step_name}/{method}-{backend}"
+                suite[name] = (_train_case(params, method, backend, step), 1)
+        suite[f"maxP linear/{geometry}"] = (lambda p=params: find_failure_load(p), 1)
+        suite[f"maxP bisection/{geometry}"] = (_bisection_case(params), 1)
+    suite["analyze_fos_nonuniform/3-span"] = (lambda: analyze_fos_nonuniform(nonuniform_params), 1)
+    splits = range(50, 400, 50)
+    suite["optimize_split/3-span"] = (
+        lambda: optimize_split(copy.deepcopy(nonuniform_params), splits, processes), len(splits))
+    for n in sweep_sizes:
+        run, designs = _sweep_case(nonuniform_params, n, processes)
+        suite[f"sweep/{n}"] = (run, designs)
+    for n in scaling_spans:
+        suite[f"scaling/{n}-span"] = (_scaling_case(n), 1)
+    return suite
+
+
+def measure(function, designs=1, repeat=3):
+    ''' Best wall time, solves per second and peak traced memory of function.
+    Solves in worker processes are not counted.'''
+    tracemalloc.start()
+    try:
+        function()
+        peak = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+    best = np.inf
+    solves = 0
+    for _ in range(repeat):
+        before = solve_count()
+        start = time.perf_counter()
+        function()
+        wall = time.perf_counter() - start
+        if wall < best:
+            best, solves = wall, solve_count() - before
+    return dict(
+        wall_s=best,
+        solves=solves,
+        solves_per_s=solves / best,
+        designs=designs,
+        designs_per_s=designs / best,
+        peak_mib=peak / 2**20,
+    )
+
+
+def metadata():
+    try:
+        commit = subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True,
+                                text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        commit = None
+    return dict(
+        commit=commit,
+        date=datetime.now(timezone.utc).isoformat(timespec="seconds"),
+        python=platform.python_version(),
+        numpy=np.__version__,
+        machine=platform.platform(),
+    )
+
+
+def run(names=None, sweep_sizes=SWEEP_SIZES, processes=1, repeat=3,
+        scaling_spans=SCALING_SPANS):
+    suite = cases(sweep_sizes, processes, scaling_spans)
+    results = {}
+    for name, (function, designs) in suite.items():
+        if names and not any(part in name for part in names):
+            continue
+        results[name] = measure(function, designs, repeat)
+        r = results[name]
+        print(f"{name:45s} {r['wall_s']:9.3f} s {r['solves_per_s']:11.0f} solves/s "
+              f"{r['peak_mib']:8.1f} MiB", flush=True)
+    summary = dict(meta=metadata(), cases=results)
+    exponents = scaling_exponents(results)
+    if exponents:
+        print(f"scaling with the number of spans: time ~ n^{exponents['wall_s']:.2f}, "
+              f"memory ~ n^{exponents['peak_mib']:.2f}")
+        summary["scaling"] = exponents
+    return summary
+
+
+def compare(baseline, current, tolerance=0.2):
+    ''' Names of the cases whose wall time grew by more than tolerance'''
+    slower = []
+    for name, now in current["cases"].items():
+        before = baseline["cases"].get(name)
+        if before is None:
+            print(f"{name:45s} new")
+            continue
+        ratio = now["wall_s"] / before["wall_s"]
+        flag = ""
+        if ratio > 1 + tolerance:
+            flag = "SLOWER"
+            slower.append(name)
+        elif ratio < 1 / (1 + tolerance):
+            flag = "faster"
+        print(f"{name:45s} {before['wall_s']:9.3f} s -> {now['wall_s']:9.3f} s "
+              f"({ratio:5.2f}x) {flag}")
+    return slower
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("-o", "--output", help="write the results to this JSON file")
+    parser.add_argument("--compare", metavar="BASELINE", help="baseline JSON file to compare with")
+    parser.add_argument("--results", help="compare this results file instead of running the suite")
+    parser.add_argument("--tolerance", type=float, default=0.2,
+                        help="relative slowdown that is flagged (default 0.2)")
+    parser.add_argument("-k", "--filter", action="append",
+                        help="only run cases whose name contains this text (repeatable)")
+    parser.add_argument("--full", action="store_true",
+                        help="sweep up to 10,000 designs and scale up to 320 spans")
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--processes", type=int, default=1, help="sweep worker processes")
+    args = parser.parse_args(argv)
+
+    if args.results:
+        with open(args.results) as f:
+            current = json.load(f)
+    else:
+        current = run(args.filter, FULL_SWEEP_SIZES if args.full else SWEEP_SIZES,
+                      args.processes, args.repeat,
+                      FULL_SCALING_SPANS if args.full else SCALING_SPANS)
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(current, f, indent=2)
+
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        slower = compare(baseline, current, args.tolerance)
+        if slower:
+            print(f"{len(slower)} case(s) slower than {args.compare}")
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
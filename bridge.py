@@ -1,7 +1,11 @@
+import logging
 import pycba as cba
 import numpy as np
 import matplotlib.pyplot as plt
 from beam_functions import BeamModel
+from envelope_cache import EnvelopeCache
+
+logging.basicConfig(level=logging.INFO, format="%(message)s")
 
 
 # Beam definition & constants
@@ -23,7 +27,8 @@ B = 80 #mm
 QGlue = 7774 #mm^3
 BGlue = 10 #mm
 
-beam = BeamModel(EI = EI)
+beam = BeamModel(EI = EI, linear=True)
+beam.cache = EnvelopeCache(".envelope_cache")
 beam.add_support(1200, "roller")
 
 def analyze_fos():
@@ -35,7 +40,8 @@ def analyze_fos():
     tensMaxMpa = MMaxNmm*yBarmm/I
     compMaxMpa = MMaxNmm*(totalHeightmm-yBarmm)/I
     
-    VMaxNmm = cvals["Vmax"]["val"]
+    # the largest shear of either sign
+    VMaxNmm = max(cvals["Vmax"]["val"], -cvals["Vmin"]["val"])
     tauMaxMPa = VMaxNmm*Q/I/B
     tauGlueMaxMPa = VMaxNmm*QGlue/I/BGlue
     
@@ -48,32 +54,32 @@ def analyze_fos():
 print(analyze_fos())
 
 def analyze_max_P():
-    for loadN in range(135, 1000, 10):
-        cvals = beam.analyze_train(loadN)
-        
-        
-        #check yielding in compression & tension at max moment
-        MMaxNmm = cvals["Mmax"]["val"]
-        tensMaxMpa = MMaxNmm*yBarmm/I
-        compMaxMpa = MMaxNmm*(totalHeightmm-yBarmm)/I
-        
-        VMaxNmm = cvals["Vmax"]["val"]
-        tauMaxMPa = VMaxNmm*Q/I/B
-        tauGlueMaxMPa = VMaxNmm*QGlue/I/BGlue
-        
-        
-        if (tensMaxMpa > strengthTensionMPa):
-            print("Failed under tension at car1 load of " + str(loadN) + " N.")
-            break
-        elif (compMaxMpa > strengthCompressionMPa):
-            print("Failed under compression at car1 load of " + str(loadN) + " N.")
-            break
-        elif (tauMaxMPa > strengthShearMPa):
-            print("Failed under shear at car1 load of " + str(loadN) + " N.")
-            break
-        elif (tauGlueMaxMPa > strenghtGlueMPa):
-            print("Failed under glue shear at car1 load of " + str(loadN) + " N.")
-            break
+    # Every stress is proportional to the car1 load, so the unit-load
+    # analysis gives the exact failure load of each check directly.
+    cvals = beam.analyze_train(1)
+
+    #check yielding in compression & tension at max moment
+    MMaxNmm = cvals["Mmax"]["val"]
+    tensMaxMpa = MMaxNmm*yBarmm/I
+    compMaxMpa = MMaxNmm*(totalHeightmm-yBarmm)/I
+
+    # the largest shear of either sign
+    VMaxNmm = max(cvals["Vmax"]["val"], -cvals["Vmin"]["val"])
+    tauMaxMPa = VMaxNmm*Q/I/B
+    tauGlueMaxMPa = VMaxNmm*QGlue/I/BGlue
+
+    failureLoadsN = {
+        "tension": strengthTensionMPa/tensMaxMpa,
+        "compression": strengthCompressionMPa/compMaxMpa,
+        "shear": strengthShearMPa/tauMaxMPa,
+        "glue shear": strenghtGlueMPa/tauGlueMaxMPa,
+    }
+    mode = min(failureLoadsN, key=failureLoadsN.get)
+    loadN = failureLoadsN[mode]
+
+    beam.analyze_train(loadN)
+    print("Failed under " + mode + " at car1 load of " + f"{loadN:.2f}" + " N.")
+    return loadN, mode
 
 
 
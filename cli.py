@@ -0,0 +1,208 @@
+''' Run FoS, failure-load, sweep and reliability jobs from design parameter files.
+
+    python cli.py fos design.toml --load 100
+    python cli.py maxp design.json --plot envelope.png
+    python cli.py sweep design.json --grid split=50:400:10 --grid "I[1]=6e5,7e5"
+    python cli.py reliability design.json --load 150 --samples 1000000
+
+A design file holds a parameter dict laid out like combination.py's
+uniform_params or nonuniform_params, as JSON or TOML. --base starts from one
+of those and the file overrides it. Results are printed as JSON. Nothing
+imports pycba or matplotlib unless the pycba backend or a plot is asked for,
+so a worker starts in about half a second.'''
+import argparse
+import heapq
+import json
+import logging
+import math
+import sys
+
+import numpy as np
+
+from combination import (BUCKLING_MODES, MATERIAL_MODES, build_beam, demands_at,
+                         find_failure_load, fos_by_mode, nonuniform_params, uniform_params)
+from envelope_cache import EnvelopeCache
+
+
+BASES = {"uniform": uniform_params, "nonuniform": nonuniform_params}
+
+MODES = {"material": MATERIAL_MODES, "all": MATERIAL_MODES + BUCKLING_MODES}
+
+
+def read_file(path):
+    ''' Contents of a JSON or TOML file'''
+    if path.endswith(".toml"):
+        try:
+            import tomllib
+        except ImportError:  # Python < 3.11
+            import tomli as tomllib
+        with open(path, "rb") as f:
+            return tomllib.load(f)
+    with open(path) as f:
+        return json.load(f)
+
+
+def load_params(path, base=None):
+    ''' Design parameters from a JSON or TOML file, over the named built-in set'''
+    params = dict(BASES[base]) if base else {}
+    params.update(read_file(path))
+    # EI is computed as E * I, so per-segment I values have to be an array
+    if isinstance(params.get("I"), list):
+        params["I"] = np.array(params["I"], dtype=float)
+    return params
+
+
+def parse_grid(entries):
+    ''' {name: values} from "name=start:stop:step" or "name=v1,v2,..." entries'''
+    grid = {}
+    for entry in entries:
+        name, _, values = entry.partition("=")
+        if not values:
+            raise ValueError(f"Grid entry {entry!r} is not name=values.")
+        if ":" in values:
+            start, stop, step = (float(v) for v in values.split(":"))
+            grid[name] = np.arange(start, stop, step).tolist()
+        else:
+            grid[name] = [float(v) for v in values.split(",")]
+    return grid
+
+
+def _finite(value):
+    # JSON has no infinity
+    return value if math.isfinite(value) else None
+
+
+def _record_fos(record):
+    # infeasible designs have no min_fos and rank last
+    fos = record.get("min_fos")
+    return -math.inf if fos is None else fos
+
+
+def save_plot(beam, path):
+    import matplotlib
+    matplotlib.use("Agg")
+    import matplotlib.pyplot as plt
+
+    fig, _ = beam.bridge_env.plot()
+    fig.savefig(path)
+    plt.close(fig)
+
+
+def run_fos(params, args):
+    beam = build_beam(params, cache=args.cache)
+    fos = fos_by_mode(demands_at(params, beam, args.load))
+    modes = [mode for mode in MODES[args.modes] if mode in fos]
+    governing = min(modes, key=fos.get)
+    if args.plot:
+        save_plot(beam, args.plot)
+    return dict(job="fos", load=args.load, fos={mode: _finite(fos[mode]) for mode in modes},
+                min=_finite(fos[governing]), governing=governing)
+
+
+def run_maxp(params, args):
+    beam = build_beam(params, cache=args.cache)
+    load, mode, loads = find_failure_load(params, beam)
+    if args.plot:
+        beam.analyze_train(load)
+        save_plot(beam, args.plot)
+    return dict(job="maxp", load=_finite(load), mode=mode,
+                loads={m: dict(load=_finite(P), at=str(at)) for m, (P, at) in loads.items()})
+
+
+def run_sweep(params, args):
+    from sweep import sweep
+
+    grid = parse_grid(args.grid)
+    if args.grid_file:
+        grid.update(read_file(args.grid_file))
+    if not grid:
+        raise ValueError("A sweep needs --grid or --grid-file.")
+    if args.stream:
+        return run_stream(params, grid, args)
+    rows = sweep(params, grid, processes=args.processes, modes=MODES[args.modes],
+                 cache_dir=args.cache_dir)
+    top = rows[:args.top] if args.top else rows
+    return dict(job="sweep", designs=len(rows),
+                rows=[dict(design=design, fos=_finite(fos)) for design, fos in top])
+
+
+def run_stream(params, grid, args):
+    # only the best args.top records are held in memory
+    from sweep import stream_sweep
+    from sweep_output import read_records
+
+    new = sum(1 for _ in stream_sweep(params, grid, args.stream, args.processes,
+                                      MODES[args.modes], args.cache_dir))
+    records = read_records(args.stream)
+    if args.top:
+        records = heapq.nlargest(args.top, records, key=_record_fos)
+    else:
+        records = sorted(records, key=_record_fos, reverse=True)
+    return dict(job="sweep", output=args.stream, evaluated=new, rows=records)
+
+
+def run_reliability(params, args):
+    from reliability import monte_carlo
+
+    result = monte_carlo(params, args.load, args.samples, beam=build_beam(params, cache=args.cache),
+                         seed=args.seed)
+    summary = result.summary()
+    summary["quantiles"] = {mode: dict(zip(("0.1%", "1%", "5%", "50%"), q.tolist()))
+                            for mode, q in summary["quantiles"].items()}
+    return dict(job="reliability", **summary)
+
+
+JOBS = {"fos": run_fos, "maxp": run_maxp, "sweep": run_sweep, "reliability": run_reliability}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("job", choices=JOBS)
+    parser.add_argument("params", help="design parameters, .json or .toml")
+    parser.add_argument("--base", choices=BASES, help="built-in parameters the file overrides")
+    parser.add_argument("--load", type=float, default=100.,
+                        help="car1 load of a fos or reliability job (N)")
+    parser.add_argument("--samples", type=int, default=10**6, help="Monte Carlo samples")
+    parser.add_argument("--seed", type=int, help="random seed of a reliability job")
+    parser.add_argument("--modes", choices=MODES, default="material")
+    parser.add_argument("--backend", choices=("banded", "pycba"),
+                        help="solver backend (default: the file's, else banded)")
+    parser.add_argument("--method", choices=("scan", "influence", "critical"),
+                        help="train method (default: the file's, else scan); critical only "
+                             "suits single-span uniform designs, whose checks use the "
+                             "extremes over the whole beam")
+    parser.add_argument("--cache-dir", help="envelope cache directory shared between runs")
+    parser.add_argument("--grid", action="append", default=[],
+                        help="sweep values, name=start:stop:step or name=v1,v2 (repeatable)")
+    parser.add_argument("--grid-file", help="sweep grid as a JSON or TOML {name: [values]} file")
+    parser.add_argument("--processes", type=int, help="sweep worker processes (default: all CPUs)")
+    parser.add_argument("--stream", metavar="PATH",
+                        help="write sweep records to a .jsonl file or chunk directory as they "
+                             "are evaluated, resuming from the records already there")
+    parser.add_argument("--top", type=int, default=10, help="best designs to report, 0 for all")
+    parser.add_argument("--plot", metavar="PATH", help="save the train envelope figure to PATH")
+    parser.add_argument("-o", "--output", help="write the JSON result here instead of stdout")
+    parser.add_argument("-v", "--verbose", action="store_true", help="log the analysis steps")
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO if args.verbose else logging.WARNING,
+                        format="%(message)s")
+    params = load_params(args.params, args.base)
+    params["backend"] = args.backend or params.get("backend", "banded")
+    params["method"] = args.method or params.get("method", "scan")
+    args.cache = EnvelopeCache(args.cache_dir) if args.cache_dir else None
+    if args.plot and args.job == "sweep":
+        parser.error("--plot applies to fos and maxp jobs")
+
+    result = JOBS[args.job](params, args)
+    text = json.dumps(result, indent=2, default=float)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(text + "\n")
+    else:
+        print(text)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,9 +1,13 @@
 import numpy as np
-import pycba as cba
-import matplotlib.pyplot as plt
-from beam_functions import BeamModel
+from beam_functions import BeamModel, span_extremes
+from cross_section import with_sections
+from envelope_cache import EnvelopeCache
+from profiling import profiled
+import logging
 import math
 
+log = logging.getLogger(__name__)
+
 beam_type = "nonuniform"    # or "uniform"
 
 
@@ -68,324 +72,374 @@ nonuniform_params = dict(
 
 # HELPER FUNCTIONS
 
-def build_beam(params):
-    ''' Call to Construct Beam Based on Given Parameters'''
-    EI = params["E"] * params["I"]
-    beam = BeamModel(EI=EI)
+@profiled
+def build_beam(params, section=None, cache=None):
+    ''' Call to Construct Beam Based on Given Parameters. section, a
+    cross_section.Section or one per segment, replaces the section entries
+    of params (see with_sections); pass the same section to the FoS checks.
+    cache is an EnvelopeCache for the train envelopes. Optional "method", "backend"
+    and "window" entries of params select the BeamModel solver, and
+    "supports" the support type at the end of each span (fillers, then a
+    roller at the end, by default; a support at the start is always a pin).'''
+    if section is not None:
+        params = with_sections(params, section)
+    EI = params["E"] * np.asarray(params["I"], dtype=float)
+    beam = BeamModel(EI=EI, linear=True, method=params.get("method", "scan"),
+                     backend=params.get("backend", "pycba"))
+    beam.window = params.get("window")
+    beam.cache = cache
 
     # Add supports
     L = params["L"]
-    for i in range(len(L)):
-        if i == len(L) - 1:
-            beam.add_support(L[i], "roller")
-        else:
-            beam.add_support(L[i], "filler")
+    supports = params.get("supports", ["filler"] * (len(L) - 1) + ["roller"])
+    if len(supports) != len(L):
+        raise ValueError(f"Expected one support type per span, got {len(supports)} for {len(L)}.")
+    for length, support_type in zip(L, supports):
+        beam.add_support(length, support_type)
     return beam
 
 
+def update_beam(beam, params):
+    ''' Bring a beam from build_beam in line with params in place, when they
+    only change EI or move interior supports (BeamModel.set_segment_ei and
+    set_span_lengths). Returns False when the beam has to be built again.'''
+    L = params["L"]
+    if (len(L) != len(beam.L) or not np.isclose(sum(L), sum(beam.L))
+            or beam.method != params.get("method", "scan")
+            or beam.backend != params.get("backend", "pycba")
+            or beam.window != params.get("window")
+            or "supports" in params):
+        return False
+    EI = np.broadcast_to(np.asarray(params["E"] * params["I"], dtype=float), (len(L),))
+    current = np.broadcast_to(np.asarray(beam.EI, dtype=float), (len(L),))
+    for segment in np.flatnonzero(EI != current):
+        beam.set_segment_ei(segment, EI[segment])
+    beam.set_span_lengths(L)
+    return True
+
+
+def segment_values(values, n_segments):
+    ''' One value per segment. Scalars and single values apply everywhere; two values for more
+    segments are (end segments, interior segments), as the support-span and
+    central-span plates in nonuniform_params.'''
+    values = np.asarray(values, dtype=float)
+    if values.ndim == 0 or len(values) == 1:
+        return np.full(n_segments, float(values.ravel()[0]))
+    if len(values) == n_segments:
+        return values
+    if len(values) == 2:
+        ends = np.zeros(n_segments, dtype=int)
+        ends[1:-1] = 1
+        return values[ends]
+    raise ValueError(f"Expected 1, 2 or {n_segments} values, got {len(values)}.")
+
+
+def station_envelope(beam):
+    ''' beam.bridge_env for checks at every station. method="critical" only
+    solves the train positions that set the extremes over the whole beam, so
+    its envelope can be low at other stations and is refused.'''
+    if beam.method == "critical":
+        raise ValueError("Station checks need method 'scan' or 'influence'; the 'critical' "
+                         "envelope only holds the extremes over the whole beam.")
+    return beam.bridge_env
+
+
 def find_span(at, spans):
-    ''' Identify Span Location. Pass in position and spans'''
-    for i, s in enumerate(spans):
-        if at < s:
-            return i
-    return len(spans) - 1
+    ''' Identify Span Location. Pass in position and span lengths (0-based result)'''
+    return min(int(np.searchsorted(np.cumsum(spans), at, side="right")), len(spans) - 1)
 
 
 # ============================================================
-# UNIFORM FOS
+# FAILURE CHECKS
 # ============================================================
 
-def analyze_uniform_fos(params, beam):
-    cvals = beam.analyze_train(135)
+MATERIAL_MODES = ("tension", "compression", "shear", "glue")
+BUCKLING_MODES = ("flange buckling", "tips buckling", "web buckling", "shear buckling")
+
 
-    M = cvals["Mmax"]["val"]
-    V = cvals["Vmax"]["val"]
+# helper for σ buckling formulas
+def sigma_buckling(C, t, b, E, denom):
+    return (C * math.pi**2 * E / denom) * (t / b)**2
 
-    print(beam.at_spans(350))
+# helper for τ buckling formula
+def tau_buckling(t, h, a, E, denom):
+    return (5 * math.pi**2 * E / denom) * ((t / h)**2 + (t / a)**2)
 
-    I = params["I"]
-    y = params["ybar"]
-    h = params["height"]
 
-    return (
-        params["strength_tension"] / (M * y / I),
-        params["strength_compression"] / (M * (h - y) / I),
-        params["strength_shear"] / (V * params["Q"] / (I * params["B"])),
-        params["strength_glue"] / (V * params["Q_glue"] / (I * params["B_glue"]))
+SECTION_KEYS = ("I", "ybar", "height", "Q", "B", "Q_glue", "B_glue")
+PLATE_KEYS = ("t1", "b1", "t2", "b2", "t3", "b3", "t4", "h4", "a",
+              "Q_Flexural_Stress_Buckling", "B_Flexural_Stress_Buckling")
+
+
+def station_sections(params, segment):
+    ''' Per-station section properties for the segment index of every station'''
+    n = len(params["L"])
+    sections = {key: segment_values(params[key], n)[segment] for key in SECTION_KEYS}
+    if "t1" in params:
+        for key in PLATE_KEYS:
+            sections[key] = segment_values(params[key], n)[segment]
+        y_plate = np.asarray(params["y_plate"], dtype=float)
+        for i, name in enumerate(("y_flange", "y_tips", "y_web")):
+            sections[name] = segment_values(y_plate[:, i], n)[segment]
+    return sections
+
+
+def mode_checks(Mmax, Mmin, Vmax, Vmin, sections, params):
+    ''' {mode: (applied stress, capacity)} of every failure mode, elementwise
+    over broadcastable arrays of load effects, sections (see station_sections)
+    and parameters'''
+    I = sections["I"]
+    y = sections["ybar"]
+    h = sections["height"]
+    V = np.maximum(Vmax, -Vmin)
+
+    # sagging puts the bottom in tension, hogging the top
+    stress = {
+        "tension": np.maximum(Mmax * y, -Mmin * (h - y)) / I,
+        "compression": np.maximum(Mmax * (h - y), -Mmin * y) / I,
+        "shear": V * sections["Q"] / (I * sections["B"]),
+        "glue": V * sections["Q_glue"] / (I * sections["B_glue"]),
+    }
+    capacity = {
+        "tension": params["strength_tension"],
+        "compression": params["strength_compression"],
+        "shear": params["strength_shear"],
+        "glue": params["strength_glue"],
+    }
+
+    if "t1" in sections:
+        E = params["E"]
+        denom = 12 * (1 - params["mu"]**2)
+        # the plates buckle under the sagging compression at the top
+        stress["flange buckling"] = Mmax * sections["y_flange"] / I
+        stress["tips buckling"] = Mmax * sections["y_tips"] / I
+        stress["web buckling"] = Mmax * sections["y_web"] / I
+        stress["shear buckling"] = (V * sections["Q_Flexural_Stress_Buckling"]
+                                    / (I * sections["B_Flexural_Stress_Buckling"]))
+        capacity["flange buckling"] = sigma_buckling(4, sections["t1"], sections["b1"], E, denom)
+        capacity["tips buckling"] = sigma_buckling(0.425, sections["t2"], sections["b2"], E, denom)
+        capacity["web buckling"] = sigma_buckling(6, sections["t3"], sections["b3"], E, denom)
+        capacity["shear buckling"] = tau_buckling(sections["t4"], sections["h4"], sections["a"], E, denom)
+
+    return {mode: (stress[mode], capacity[mode]) for mode in stress}
+
+
+def mode_fos(Mmax, Mmin, Vmax, Vmin, sections, params):
+    ''' {mode: FoS} of every failure mode, see mode_checks'''
+    checks = mode_checks(Mmax, Mmin, Vmax, Vmin, sections, params)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        return {mode: np.where(stress > 0, capacity / stress, np.inf)
+                for mode, (stress, capacity) in checks.items()}
+
+
+@profiled
+def nonuniform_demands(params, beam, cvals):
+    ''' (mode, location, applied stress, capacity) for every check of a
+    nonuniform beam. Each span is checked at its own worst stations with its
+    own section (see segment_values), so the location of the smallest FoS of
+    a mode, "span k" counting from 1, is the span that governs it.'''
+    n = len(params["L"])
+    (Mmax, Mmin, Vmax, Vmin), _ = span_extremes(station_envelope(beam), np.cumsum(params["L"])[:-1])
+    V = np.maximum(Vmax, -Vmin)
+    worst = int(np.argmax(np.maximum(Mmax, -Mmin)))
+    log.info("The largest moment, %s, is in span %d", max(Mmax[worst], -Mmin[worst]), worst + 1)
+    log.info("The largest shear, %s, is in span %d", V.max(), int(np.argmax(V)) + 1)
+
+    checks = mode_checks(Mmax, Mmin, Vmax, Vmin, station_sections(params, np.arange(n)), params)
+    demands = []
+    for k in range(n):
+        span = f"span {k + 1}"
+        demands += [(mode, span, np.broadcast_to(stress, (n,))[k], np.broadcast_to(capacity, (n,))[k])
+                    for mode, (stress, capacity) in checks.items()]
+    return demands
+
+
+@profiled
+def demands_at(params, beam, load):
+    ''' Run the train at the given car1 load and return every check'''
+    cvals = beam.analyze_train(load)
+    if np.ndim(params["I"]) == 0 and len(params["L"]) == 1:
+        # one section over one span: the extremes of every method's envelope govern
+        extremes = (cvals[effect]["val"] for effect in ("Mmax", "Mmin", "Vmax", "Vmin"))
+        checks = mode_checks(*extremes, station_sections(params, 0), params)
+        return [(mode, "span", stress, capacity) for mode, (stress, capacity) in checks.items()]
+    return nonuniform_demands(params, beam, cvals)
+
+
+def fos_by_mode(demands):
+    ''' Smallest factor of safety of each failure mode over all locations'''
+    fos = {}
+    for mode, span, stress, capacity in demands:
+        fos[mode] = min(fos.get(mode, math.inf), capacity / stress if stress > 0 else math.inf)
+    return fos
+
+
+def fos_locations(demands):
+    ''' Smallest factor of safety of each failure mode with the location where it occurs,
+    as {mode: (fos, location)}'''
+    found = {}
+    for mode, span, stress, capacity in demands:
+        fos = capacity / stress if stress > 0 else math.inf
+        if mode not in found or fos < found[mode][0]:
+            found[mode] = (fos, span)
+    return found
+
+
+@profiled
+def fos_report(params, modes=MATERIAL_MODES, cache=None, load=100., beam=None, section=None):
+    ''' FoS of each mode at the car1 load with where it governs, plus the
+    governing mode, its FoS and the failure load. Beams from build_beam are
+    linear and carry no static loads, so the failure load is load * min FoS.
+    section replaces the section entries of params, as in build_beam.'''
+    if section is not None:
+        params = with_sections(params, section)
+    if beam is None:
+        beam = build_beam(params, cache=cache)
+    found = fos_locations(demands_at(params, beam, load))
+    modes = [mode for mode in modes if mode in found]
+    mode = min(modes, key=lambda m: found[m][0])
+    return dict(
+        fos={m: found[m][0] for m in modes},
+        at={m: found[m][1] for m in modes},
+        mode=mode,
+        min_fos=found[mode][0],
+        failure_load=load * found[mode][0],
     )
 
 
 # ============================================================
-# UNIFORM MAX P
+# FAILURE LOAD
 # ============================================================
 
-def analyze_uniform_maxP(params, beam):
-    for load in range(135, 2000, 10):
-
-        c = beam.analyze_train(load)
-        M = c["Mmax"]["val"]
-        V = c["Vmax"]["val"]
-        
-
-        I = params["I"]
-        y = params["ybar"]
-        h = params["height"]
-
-        tens = M * y / I
-        comp = M * (h - y) / I
-        shear = V * params["Q"] / (I * params["B"])
-        glue = V * params["Q_glue"] / (I * params["B_glue"])
-        print(glue)
-
-        if tens > params["strength_tension"]:
-            print(f"FAILED tension at P={load} N")
-            break
-        if comp > params["strength_compression"]:
-            print(f"FAILED compression at P={load} N")
-            break
-        if shear > params["strength_shear"]:
-            print(f"FAILED shear at P={load} N")
-            break
-        if glue > params["strength_glue"]:
-            print(f"FAILED glue shear at P={load} N")
-            break
-
-    beam.display()
+@profiled
+def find_failure_load(params, beam=None, tol=0.01, section=None):
+    ''' Car1 load at which every check fails; section replaces the section
+    entries of params, as in build_beam.
+    Returns (governing load, governing mode, {mode: (load, location)})'''
+    if section is not None:
+        params = with_sections(params, section)
+    if beam is None:
+        beam = build_beam(params)
+
+    if beam.linear and not beam.has_static_loads():
+        # Every stress is proportional to the car1 load, so a single
+        # unit-load analysis gives each failure load directly.
+        loads = {}
+        for mode, span, stress, capacity in demands_at(params, beam, 1.):
+            load = capacity / stress if stress > 0 else math.inf
+            if load < loads.get(mode, (math.inf,))[0]:
+                loads[mode] = (load, span)
+    else:
+        loads = _bisect_failure_loads(params, beam, tol)
+
+    mode = min(loads, key=lambda m: loads[m][0])
+    return loads[mode][0], mode, loads
+
+
+@profiled
+def _bisect_failure_loads(params, beam, tol, first_guess=100., max_load=1e7):
+    ''' Bisection on each check, for beams whose stresses are not linear in the load'''
+    memo = {}
+
+    def ratios(load):
+        # worst stress / capacity of each mode, shared between the modes
+        if load not in memo:
+            worst = {}
+            for mode, span, stress, capacity in demands_at(params, beam, load):
+                if stress / capacity > worst.get(mode, (-math.inf,))[0]:
+                    worst[mode] = (stress / capacity, span)
+            memo[load] = worst
+        return memo[load]
+
+    loads = {}
+    for mode in ratios(0.):
+        lo, hi = 0., first_guess
+        if ratios(lo)[mode][0] >= 1:
+            loads[mode] = (0., ratios(lo)[mode][1])
+            continue
+        while ratios(hi)[mode][0] < 1 and hi < max_load:
+            lo, hi = hi, 2 * hi
+        if ratios(hi)[mode][0] < 1:
+            loads[mode] = (math.inf, ratios(hi)[mode][1])
+            continue
+        while hi - lo > tol:
+            mid = (lo + hi) / 2
+            if ratios(mid)[mode][0] < 1:
+                lo = mid
+            else:
+                hi = mid
+        loads[mode] = (hi, ratios(hi)[mode][1])
+    return loads
 
 
 # ============================================================
-# NONUNIFORM MAX P  (now includes shear + glue too)
+# UNIFORM FOS
 # ============================================================
 
-def optimize_split(params):
-    prev = 10000
-    best = 0
-    for i in range(10, 400, 20):
-        params["L"] = [i, 1200-2*i, i]
+@profiled
+def analyze_uniform_fos(params, beam):
+    demands = demands_at(params, beam, 135)
 
-        new_val = analyze_fos_nonuniform(params)
-        if new_val <= prev:
-            best = i
-    print(f"The optimal split is at {best} mm")
-    
+    beam.at_spans(350)
 
-def analyze_fos_nonuniform(params):
-    beam = build_beam(params)
-    cvals = beam.analyze_train(100)
+    fos = fos_by_mode(demands)
+    return tuple(fos[mode] for mode in MATERIAL_MODES)
 
-    spans = np.cumsum(params["L"])
-
-
-    tensMaxMpa = {}
-    compMaxMpa = {}
-    shearPlateMax = {}
-    shearGlueMax = {}
-
-    target_Moment_y_1, target_Shear_y_1 = beam.at_spans(spans[0])
-    target_Moment_y_2, target_Shear_y_2 = beam.at_spans(0)
-    target_Moment_y_3, target_Shear_y_3 = beam.at_spans(1200)
-    target_Moment_y_4, target_Shear_y_4 = beam.at_spans(spans[1])
-    maxMoment = max(target_Moment_y_1, target_Moment_y_2, target_Moment_y_3, target_Moment_y_4)
-    maxShear = max(target_Shear_y_1, target_Shear_y_2, target_Shear_y_3, target_Shear_y_4)
-    print(f"The Max Moment Relevant for the First Span is {maxMoment}")
-    print(f"The Max Shear Relevant for the First Span is {maxShear}")
-
-    #Providing Relevant Features for the Seperate Spans
-    I_support_span = params["I"][0]
-    y_support_span = params["ybar"][0]
-    h_support_span = params["height"][0]
-    tensMaxMpa["shear-designed span"] =  maxMoment * y_support_span / I_support_span
-    compMaxMpa["shear-designed span"] = maxMoment * (h_support_span - y_support_span) / I_support_span
-
-    shearPlateMax["shear-designed span"] = maxShear * params["Q"][0] / (I_support_span * params["B"][0])
-    shearGlueMax["shear-designed span"] = maxShear * params["Q_glue"][0] / (I_support_span * params["B_glue"][0])
-
-    #It is known max Moment always occurs in the central span, so this is hard-coded.
-    M_central_Span = cvals["Mmax"]["val"]
-    V_central_span = max(target_Shear_y_1, target_Shear_y_4)
-    print(f"The Max Shear Relevant for the Central Span is {V_central_span}")
-    print(f"The Max Moment Relevant for the Central Span is {M_central_Span}")
-
-
-    
-    # Define Parameters for that Span
-    I = params["I"][1]
-    y = params["ybar"][1]
-    h = params["height"][1]
-
-    # bending stresses
-    tensMaxMpa["moment-designed span"] =  M_central_Span * y / I
-    compMaxMpa["moment-designed span"] = M_central_Span * (h - y) / I
-
-    # shear stresses (constants)
-    shearPlateMax["moment-designed span"] = V_central_span * params["Q"][1] / (I * params["B"][1])
-    shearGlueMax["moment-designed span"] = V_central_span * params["Q_glue"][1] / (I * params["B_glue"][1])
-
-    tens = max(tensMaxMpa.values())
-    comp = max(compMaxMpa.values())
-    shear = max(shearPlateMax.values())
-    glue = max(shearGlueMax.values())
-
-    FOS_c5 = []
-    FOS_c6 = []
-    FOS_c7 = []
-    FOS_c8 = []
-
-    denom = 12 * (1 - params["mu"]**2)
-    
-    span_1_sigma1 = (4 * math.pi**2 * params["E"] / denom) * (params["t1"][0] / params["b1"][0])**2
-    span_1_sigma2 = (0.425 * math.pi**2 * params["E"] / denom) * (params["t2"][0] / params["b2"][0])**2
-    span_1_sigma3 = (6 * math.pi**2 * params["E"] / denom) * (params["t3"][0] / params["b3"][0])**2
-    span_1_tau    = (5 * math.pi**2 * params["E"] / denom) * ((params["t4"][0] / params["h4"][0])**2 + (params["t4"][0] / params["a"][0])**2)
-
-    span_1_flange = maxMoment * params["y_plate"][0][0]/ I_support_span
-    span_1_tips = maxMoment * params["y_plate"][0][1]/ I_support_span
-    span_1_web = maxMoment * params["y_plate"][0][2]/ I_support_span
-    span_1_flexural = maxShear * params["Q Flexural Stress Buckling"][0] / (I_support_span * params["B Flexural Stess Buckling"][0])
-
-    FOS_c5.append(span_1_sigma1/span_1_flange)
-    FOS_c6.append(span_1_sigma2/span_1_tips)
-    FOS_c7.append(span_1_sigma3/span_1_web)
-    FOS_c8.append(span_1_tau/span_1_flexural)
-
-    span_2_sigma1 = (4 * math.pi**2 * params["E"] / denom) * (params["t1"][1] / params["b1"][1])**2
-    span_2_sigma2 = (0.425 * math.pi**2 * params["E"] / denom) * (params["t2"][1] / params["b2"][1])**2
-    span_2_sigma3 = (6 * math.pi**2 * params["E"] / denom) * (params["t3"][1] / params["b3"][1])**2
-    span_2_tau    = (5 * math.pi**2 * params["E"] / denom) * ((params["t4"][1] / params["h4"][1])**2 + (params["t4"][1] / params["a"][1])**2)
-
-    span_2_flange = maxMoment * params["y_plate"][1][0]/ I_support_span
-    span_2_tips = maxMoment * params["y_plate"][1][1]/ I_support_span
-    span_2_web = maxMoment * params["y_plate"][1][2]/ I_support_span
-    span_2_flexural = maxShear * params["Q Flexural Stress Buckling"][1] / (I_support_span * params["B Flexural Stess Buckling"][1])
-
-    FOS_c5.append(span_2_sigma1/span_2_flange)
-    FOS_c6.append(span_2_sigma2/span_2_tips)
-    FOS_c7.append(span_2_sigma3/span_2_web)
-    FOS_c8.append(span_2_tau/span_2_flexural)
-
-    FOS_c5, FOS_c6, FOS_c7, FOS_c8 = [], [], [], []
-
-    denom = 12 * (1 - params["mu"]**2)
-    E = params["E"]
-    for i in range(len(params["t1"])):
-
-        # --- Buckling stresses ---
-        sigma1 = sigma_buckling(4,     params["t1"][i], params["b1"][i], E, denom)
-        sigma2 = sigma_buckling(0.425, params["t2"][i], params["b2"][i], E, denom)
-        sigma3 = sigma_buckling(6,     params["t3"][i], params["b3"][i], E, denom)
-        tau    = tau_buckling(params["t4"][i], params["h4"][i], params["a"][i], E, denom)
-
-        # --- Applied stresses ---
-        flange_stress   = maxMoment * params["y_plate"][i][0] / I_support_span
-        tips_stress     = maxMoment * params["y_plate"][i][1] / I_support_span
-        web_stress      = maxMoment * params["y_plate"][i][2] / I_support_span
-        flexural_stress = (maxShear * params["Q Flexural Stress Buckling"][i] /
-                        (I_support_span * params["B Flexural Stess Buckling"][i]))
-
-        # --- Factors of Safety ---
-        FOS_c5.append(sigma1 / flange_stress)
-        FOS_c6.append(sigma2 / tips_stress)
-        FOS_c7.append(sigma3 / web_stress)
-        FOS_c8.append(tau    / flexural_stress)
-
-    return (min(params["strength_tension"] / tens,
-        params["strength_compression"] / comp,
-        params["strength_shear"] / shear,
-        params["strength_glue"] / glue))
 
+# ============================================================
+# UNIFORM MAX P
+# ============================================================
 
+@profiled
+def analyze_uniform_maxP(params, beam):
+    load, mode, loads = find_failure_load(params, beam)
+    for m, (P, span) in loads.items():
+        log.info("%s fails at P=%.2f N", m, P)
+    log.info("FAILED %s at P=%.2f N", mode, load)
 
+    beam.analyze_train(load)
+    beam.display()
 
-# helper for σ buckling formulas
-def sigma_buckling(C, t, b, E, denom):
-    return (C * math.pi**2 * E / denom) * (t / b)**2
 
-# helper for τ buckling formula
-def tau_buckling(t, h, a, E, denom):
-    return (5 * math.pi**2 * E / denom) * ((t / h)**2 + (t / a)**2)
+# ============================================================
+# NONUNIFORM MAX P  (now includes shear + glue too)
+# ============================================================
 
+@profiled
+def optimize_split(params, splits=range(10, 400, 20), processes=None, cache_dir=None):
+    ''' Sweep the support-span length across a process pool and keep the best'''
+    from sweep import sweep, split_spans
+
+    rows = sweep(params, {"split": splits}, processes=processes, cache_dir=cache_dir)
+    best, fos = rows[0]
+    params["L"] = split_spans(best["split"])
+    log.info("The optimal split is at %s mm (FoS = %.3f)", best["split"], fos)
+    return rows
+
+
+@profiled
+def analyze_fos_nonuniform(params, modes=MATERIAL_MODES, cache=None, beam=None, section=None):
+    ''' Minimum FoS over the given failure modes (add BUCKLING_MODES to include plate buckling).
+    section replaces the section entries of params, as in build_beam.'''
+    if section is not None:
+        params = with_sections(params, section)
+    if beam is None:
+        beam = build_beam(params, cache=cache)
+    cvals = beam.analyze_train(100)
 
-def analyze_nonuniform_maxP(params, beam):
+    fos = fos_by_mode(nonuniform_demands(params, beam, cvals))
+    return min(fos[mode] for mode in modes)
 
-    spans = np.cumsum(params["L"])
-
-    for load in range(135, 2000, 10):
-
-        c = beam.analyze_train(load)
-
-        tensMaxMpa = {}
-        compMaxMpa = {}
-        shearPlateMax = {}
-        shearGlueMax = {}
-
-        target_Moment_y_1, target_Shear_y_1 = beam.at_spans(spans[0])
-        target_Moment_y_2, target_Shear_y_2 = beam.at_spans(0)
-        target_Moment_y_3, target_Shear_y_3 = beam.at_spans(1200)
-        target_Moment_y_4, target_Shear_y_4 = beam.at_spans(spans[1])
-        maxMoment = max(target_Moment_y_1, target_Moment_y_2, target_Moment_y_3, target_Moment_y_4)
-        maxShear = max(target_Shear_y_1, target_Shear_y_2, target_Shear_y_3, target_Shear_y_4)
-        print(f"The Max Moment Relevant for the First Span is {maxMoment}")
-        print(f"The Max Shear Relevant for the First Span is {maxShear}")
-
-        #Providing Relevant Features for the Seperate Spans
-        I_support_span = params["I"][0]
-        y_support_span = params["ybar"][0]
-        h_support_span = params["height"][0]
-        tensMaxMpa["shear-designed span"] =  maxMoment * y_support_span / I_support_span
-        compMaxMpa["shear-designed span"] = maxMoment * (h_support_span - y_support_span) / I_support_span
-
-        shearPlateMax["shear-designed span"] = maxShear * params["Q"][0] / (I_support_span * params["B"][0])
-        shearGlueMax["shear-designed span"] = maxShear * params["Q_glue"][0] / (I_support_span * params["B_glue"][0])
-
-        #It is known max Moment always occurs in the central span, so this is hard-coded.
-        M_central_Span = c["Mmax"]["val"]
-        V_central_span = max(target_Shear_y_1, target_Shear_y_4)
-        print(f"The Max Shear Relevant for the Central Span is {V_central_span}")
-        print(f"The Max Moment Relevant for the Central Span is {M_central_Span}")
-
-
-        
-        # Define Parameters for that Span
-        I = params["I"][1]
-        y = params["ybar"][1]
-        h = params["height"][1]
-
-        # bending stresses
-        tensMaxMpa["moment-designed span"] =  M_central_Span * y / I
-        compMaxMpa["moment-designed span"] = M_central_Span * (h - y) / I
-
-        # shear stresses (constants)
-        shearPlateMax["moment-designed span"] = V_central_span * params["Q"][1] / (I * params["B"][1])
-        shearGlueMax["moment-designed span"] = V_central_span * params["Q_glue"][1] / (I * params["B_glue"][1])
-
-        tens = max(tensMaxMpa.values())
-        comp = max(compMaxMpa.values())
-        shear = max(shearPlateMax.values())
-        glue = max(shearGlueMax.values())
-
-
-        if tens > params["strength_tension"]:
-            print(f"FAILED tension at P={load} N)")
-            result = [key for key, value in tensMaxMpa.items() if value == tens]
-            print(f"Failed at the {result}")
-            break
-        if comp > params["strength_compression"]:
-            print(compMaxMpa.items())
-            print(f"FAILED compression at P={load} N)")
-            result = [key for key, value in compMaxMpa.items() if value == comp]
-            print(f"Failed at the {result}")
-            break
-        if shear > params["strength_shear"]:
-            print(f"FAILED shear at P={load} N ")
-            result = [key for key, value in shearPlateMax.items() if value == shear]
-            print(f"Failed at the {result}")
-            break
-        if glue > params["strength_glue"]:
-            print(f"FAILED glue shear at P={load} N")
-            result = [key for key, value in shearGlueMax.items() if value == glue]
-            print(f"Failed at the {result}")
-            break
 
+@profiled
+def analyze_nonuniform_maxP(params, beam):
+    load, mode, loads = find_failure_load(params, beam)
+    for m, (P, span) in loads.items():
+        log.info("%s fails at P=%.2f N in the %s", m, P, span)
+    log.info("FAILED %s at P=%.2f N", mode, load)
+    log.info("Failed at the %s", loads[mode][1])
+
+    beam.analyze_train(load)
     beam.display()
 
 
@@ -393,14 +447,17 @@ def analyze_nonuniform_maxP(params, beam):
 # RUN THE CHOSEN ANALYSIS
 # ============================================================
 
-if beam_type == "nonuniform":
-    params = uniform_params
-    beam = build_beam(params)
-    print("FoS =", analyze_uniform_fos(params, beam))
-    #analyze_uniform_maxP(params, beam)
-
-else:
-    params = nonuniform_params
-    optimize_split(params)
-    beam = build_beam(params)
-    analyze_nonuniform_maxP(params, beam)
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format="%(message)s")
+    cache_dir = ".envelope_cache"
+    if beam_type == "nonuniform":
+        params = uniform_params
+        beam = build_beam(params, cache=EnvelopeCache(cache_dir))
+        print("FoS =", analyze_uniform_fos(params, beam))
+        #analyze_uniform_maxP(params, beam)
+
+    else:
+        params = nonuniform_params
+        optimize_split(params, cache_dir=cache_dir)
+        beam = build_beam(params, cache=EnvelopeCache(cache_dir))
+        analyze_nonuniform_maxP(params, beam)
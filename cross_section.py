@@ -0,0 +1,111 @@
+from functools import lru_cache
+
+import numpy as np
+
+
+# Keys of the design parameter dicts that come from the section geometry
+SECTION_PARAMS = ("I", "ybar", "height", "Q", "B", "Q_glue", "B_glue")
+
+
+def section_properties(plates, glue_y=None, glue_width=None):
+    ''' Properties of sections built from rectangular plates, vectorized over a
+    batch. plates has shape (..., n_plates, 3) with rows (width, thickness,
+    y of the plate bottom), all measured from the bottom of the section.
+    Q and B are taken at the centroid; Q_glue at glue_y, where the glue joint
+    has width glue_width. Returns a dict of arrays of shape (...)'''
+    plates = np.asarray(plates, dtype=float)
+    b, t, y0 = plates[..., 0], plates[..., 1], plates[..., 2]
+    top = y0 + t
+
+    area = b * t
+    A = area.sum(axis=-1)
+    ybar = (area * (y0 + t / 2)).sum(axis=-1) / A
+    I = (b * t**3 / 12 + area * (y0 + t / 2 - ybar[..., None])**2).sum(axis=-1)
+
+    props = dict(
+        A=A,
+        I=I,
+        ybar=ybar,
+        height=top.max(axis=-1),
+        Q=first_moment(plates, ybar, ybar),
+        B=np.where((y0 <= ybar[..., None]) & (top > ybar[..., None]), b, 0).sum(axis=-1),
+    )
+    if glue_y is not None:
+        props["Q_glue"] = first_moment(plates, np.asarray(glue_y, dtype=float), ybar)
+        props["B_glue"] = np.broadcast_to(np.asarray(glue_width, dtype=float), ybar.shape)
+    return props
+
+
+def first_moment(plates, y, ybar):
+    ''' First moment about the centroid of the area above y'''
+    plates = np.asarray(plates, dtype=float)
+    b, t, y0 = plates[..., 0], plates[..., 1], plates[..., 2]
+    y = np.asarray(y, dtype=float)[..., None]
+    lower = np.clip(y, y0, y0 + t)
+    return (b * (y0 + t - lower) * ((y0 + t + lower) / 2 - ybar[..., None])).sum(axis=-1)
+
+
+@lru_cache(maxsize=4096)
+def _cached_properties(plates, glue):
+    props = section_properties(plates, *glue) if glue else section_properties(plates)
+    return {key: float(value) for key, value in props.items()}
+
+
+class Section:
+    ''' Cross-section built from rectangular (width, thickness, y bottom) plates,
+    optionally with a glue joint (y, width). buckling holds the indices of the
+    compression flange, its tips and the web plate, whose heights above the
+    centroid give y_plate for the buckling checks. Properties are memoized by
+    geometry, so sections rebuilt with the same plates in sweeps cost nothing.'''
+    def __init__(self, plates, glue=None, buckling=None):
+        self.plates = tuple(tuple(float(v) for v in plate) for plate in plates)
+        self.glue = tuple(float(v) for v in glue) if glue is not None else None
+        self.buckling = tuple(int(i) for i in buckling) if buckling is not None else None
+        self.properties = _cached_properties(self.plates, self.glue)
+
+    def __getattr__(self, name):
+        try:
+            return self.__dict__["properties"][name]
+        except KeyError:
+            raise AttributeError(name) from None
+
+    def __eq__(self, other):
+        return (isinstance(other, Section) and (self.plates, self.glue, self.buckling)
+                == (other.plates, other.glue, other.buckling))
+
+    def __hash__(self):
+        return hash((self.plates, self.glue, self.buckling))
+
+    def __repr__(self):
+        return f"Section({list(self.plates)}, glue={self.glue}, buckling={self.buckling})"
+
+    def y_plate(self, i):
+        ''' Distance from the centroid to the top of plate i, for the buckling checks'''
+        _, t, y0 = self.plates[i]
+        return y0 + t - self.ybar
+
+    def params(self):
+        ''' Section entries of a design parameter dict, with y_plate as
+        [[y_flange, y_tips, y_web]] when the buckling plates are known'''
+        params = {key: self.properties[key] for key in SECTION_PARAMS if key in self.properties}
+        if self.buckling is not None:
+            params["y_plate"] = [[self.y_plate(i) for i in self.buckling]]
+        return params
+
+
+def with_sections(params, sections):
+    ''' Copy of params with the section entries computed from one Section for
+    the whole beam or a list of one Section per segment. Entries a section
+    cannot give (Q_glue without a glue joint, y_plate without the buckling
+    plates) keep their values from params.'''
+    params = dict(params)
+    if isinstance(sections, Section):
+        params.update(sections.params())
+        return params
+    entries = [section.params() for section in sections]
+    for key in SECTION_PARAMS + ("y_plate",):
+        if all(key in entry for entry in entries):
+            values = [entry[key] for entry in entries]
+            # y_plate has one row per segment
+            params[key] = np.concatenate(values) if key == "y_plate" else np.array(values)
+    return params
@@ -0,0 +1,90 @@
+import hashlib
+import json
+import os
+import zipfile
+
+import numpy as np
+
+
+def _jsonable(value):
+    if isinstance(value, np.ndarray):
+        return value.tolist()
+    if isinstance(value, np.generic):
+        return value.item()
+    raise TypeError(f"Cannot serialize {type(value).__name__}")
+
+
+def content_hash(*parts):
+    ''' Hex digest of numbers, lists and arrays, equal for equal contents'''
+    text = json.dumps(parts, default=_jsonable, sort_keys=True)
+    return hashlib.sha256(text.encode()).hexdigest()
+
+
+class EnvelopeCache:
+    ''' Train envelopes and critical values stored as .npz files in directory,
+    one per content hash. Loading a file marks it as used; when the files
+    exceed max_bytes the least recently used ones are deleted. Files are
+    written to a temporary name and renamed, so sweep workers can share one
+    directory.'''
+    def __init__(self, directory, max_bytes=256 * 2**20):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        os.makedirs(directory, exist_ok=True)
+
+    def path(self, key):
+        return os.path.join(self.directory, key + ".npz")
+
+    def load(self, key):
+        ''' (arrays, cvals) stored under key, or None'''
+        path = self.path(key)
+        try:
+            with np.load(path, allow_pickle=False) as data:
+                arrays = {name: data[name] for name in data.files}
+            os.utime(path)
+        except FileNotFoundError:
+            return None
+        except (OSError, ValueError, zipfile.BadZipFile):
+            # a truncated or foreign file is dropped and recomputed
+            self._remove(path)
+            return None
+        cvals = json.loads(str(arrays.pop("cvals")))
+        return arrays, cvals
+
+    def store(self, key, arrays, cvals):
+        path = self.path(key)
+        tmp = f"{path}.{os.getpid()}.tmp"
+        with open(tmp, "wb") as f:
+            np.savez(f, cvals=np.array(json.dumps(cvals, default=_jsonable)), **arrays)
+        os.replace(tmp, path)
+        self.evict()
+
+    def evict(self):
+        ''' Delete least recently used files until the cache fits in max_bytes'''
+        entries = []
+        for entry in os.scandir(self.directory):
+            if entry.name.endswith(".npz"):
+                try:
+                    stat = entry.stat()
+                except FileNotFoundError:
+                    continue
+                entries.append((stat.st_mtime, stat.st_size, entry.path))
+        entries.sort()
+        total = sum(size for _, size, _ in entries)
+        # the newest file is always kept, even if it alone is over the limit
+        for _, size, path in entries[:-1]:
+            if total <= self.max_bytes:
+                break
+            self._remove(path)
+            total -= size
+
+    def clear(self):
+        for entry in os.scandir(self.directory):
+            if entry.name.endswith(".npz"):
+                self._remove(entry.path)
+
+    @staticmethod
+    def _remove(path):
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
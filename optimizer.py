@@ -0,0 +1,79 @@
+import math
+
+import numpy as np
+from scipy.optimize import differential_evolution
+
+from combination import BUCKLING_MODES, MATERIAL_MODES
+from sweep import apply_overrides, evaluation_map, is_feasible
+
+
+# Search ranges for the nonuniform girder (mm, mm⁴). Keys follow sweep.apply_overrides.
+DEFAULT_BOUNDS = {
+    "split": (50, 450),
+    "I[0]": (3e5, 1.5e6), "I[1]": (3e5, 1.5e6), "I[2]": (3e5, 1.5e6),
+    "ybar[0]": (40, 120), "ybar[1]": (40, 120), "ybar[2]": (40, 120),
+    "height[0]": (60, 160), "height[1]": (60, 160), "height[2]": (60, 160),
+    "t1[0]": (1, 20), "t1[1]": (1, 20), "b1[0]": (10, 100), "b1[1]": (10, 100),
+    "t2[0]": (1, 20), "t2[1]": (1, 20), "b2[0]": (10, 100), "b2[1]": (10, 100),
+    "t3[0]": (1, 20), "t3[1]": (1, 20), "b3[0]": (10, 100), "b3[1]": (10, 100),
+    "t4[0]": (1, 20), "t4[1]": (1, 20), "h4[0]": (20, 150), "h4[1]": (20, 150),
+    "a[0]": (10, 400), "a[1]": (10, 400),
+}
+
+# Objective given to designs that fail is_feasible, in place of -FoS
+INFEASIBLE = 1e6
+
+
+class DesignObjective:
+    ''' -min FoS of a population of design vectors, for a vectorized optimizer.
+    Designs are memoized after rounding, infeasible ones are rejected before
+    any analysis and the new ones are evaluated together over the pool.'''
+    def __init__(self, params, names, evaluate_all, decimals=2):
+        self.params = params
+        self.names = names
+        self.evaluate_all = evaluate_all
+        self.decimals = decimals
+        self.memo = {}  # rounded design vector -> min FoS (-inf if infeasible)
+        self.rejected = 0
+
+    def __call__(self, X):
+        X = np.asarray(X).reshape(len(self.names), -1)
+        keys = [tuple(np.round(x, self.decimals).tolist()) for x in X.T]
+
+        todo = []
+        for key in dict.fromkeys(keys):
+            if key in self.memo:
+                continue
+            overrides = dict(zip(self.names, key))
+            if is_feasible(apply_overrides(self.params, overrides)):
+                todo.append(overrides)
+            else:
+                self.memo[key] = -math.inf
+                self.rejected += 1
+
+        for overrides, fos in self.evaluate_all(todo):
+            self.memo[tuple(overrides[name] for name in self.names)] = fos
+
+        return np.array([-self.memo[key] if self.memo[key] > -math.inf else INFEASIBLE
+                         for key in keys])
+
+    def best(self):
+        key = max(self.memo, key=self.memo.get)
+        return dict(zip(self.names, key)), self.memo[key]
+
+
+def optimize_design(params, bounds=DEFAULT_BOUNDS, modes=MATERIAL_MODES + BUCKLING_MODES,
+                    maxiter=100, popsize=15, processes=None, seed=None, decimals=2,
+                    cache_dir=None):
+    ''' Maximize the minimum FoS of analyze_fos_nonuniform over the variables in
+    bounds with a bounded differential evolution, evaluating each generation
+    across a process pool. Returns (best overrides, best FoS, objective); the
+    objective's memo holds every design evaluated.'''
+    names = list(bounds)
+    with evaluation_map(params, processes, modes, cache_dir=cache_dir) as evaluate_all:
+        objective = DesignObjective(params, names, evaluate_all, decimals)
+        differential_evolution(objective, [bounds[name] for name in names],
+                               maxiter=maxiter, popsize=popsize, seed=seed,
+                               vectorized=True, updating="deferred", polish=False)
+    best, fos = objective.best()
+    return best, fos, objective
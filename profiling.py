@@ -0,0 +1,168 @@
+''' Opt-in timing of the analysis phases.
+
+Functions decorated with @profiled and blocks inside phase(name) are timed
+while profiling is enabled:
+
+    with profiling.profile():
+        analyze_fos_nonuniform(params)
+    profiling.write_json("profile.json")
+    profiling.write_collapsed("profile.folded")   # flamegraph.pl / speedscope
+
+report() gives each phase's call count, total and self time, percentiles of
+the call times and the net memory blocks allocated inside it (and traced
+bytes with memory=True). Disabled, a decorated call costs one flag check.
+Each process keeps its own counters, so profile sweeps with processes=1.'''
+import functools
+import json
+import sys
+import time
+import tracemalloc
+from contextlib import contextmanager, nullcontext
+
+import numpy as np
+
+
+_enabled = False
+_memory = False
+_started_tracemalloc = False
+
+_stats = {}
+_stack = []
+_folded = {}
+
+_NULL = nullcontext()
+
+
+class _PhaseStats:
+    __slots__ = ("times", "self_time", "blocks", "bytes")
+
+    def __init__(self):
+        self.times = []
+        self.self_time = 0.
+        self.blocks = 0
+        self.bytes = None
+
+
+class _Phase:
+    __slots__ = ("name", "start", "children", "blocks", "bytes")
+
+    def __init__(self, name):
+        self.name = name
+
+    def __enter__(self):
+        self.children = 0.
+        self.blocks = sys.getallocatedblocks()
+        self.bytes = tracemalloc.get_traced_memory()[0] if _memory else 0
+        _stack.append(self)
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        elapsed = time.perf_counter() - self.start
+        _stack.pop()
+        if _stack:
+            _stack[-1].children += elapsed
+        stats = _stats.get(self.name)
+        if stats is None:
+            stats = _stats[self.name] = _PhaseStats()
+        stats.times.append(elapsed)
+        stats.self_time += elapsed - self.children
+        stats.blocks += sys.getallocatedblocks() - self.blocks
+        if _memory:
+            stats.bytes = (stats.bytes or 0) + tracemalloc.get_traced_memory()[0] - self.bytes
+        stack = ";".join([frame.name for frame in _stack] + [self.name])
+        _folded[stack] = _folded.get(stack, 0.) + elapsed - self.children
+        return False
+
+
+def phase(name):
+    ''' Context manager timing a block as the phase name'''
+    return _Phase(name) if _enabled else _NULL
+
+
+def profiled(function=None, *, name=None):
+    ''' Decorator timing every call of a function as a phase named after its
+    qualified name, or name'''
+    def decorate(function):
+        label = name or function.__qualname__
+
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            if not _enabled:
+                return function(*args, **kwargs)
+            with _Phase(label):
+                return function(*args, **kwargs)
+        return wrapper
+
+    return decorate(function) if function is not None else decorate
+
+
+def enable(memory=False):
+    ''' Start recording. memory=True also traces allocated bytes with
+    tracemalloc, which slows everything down noticeably.'''
+    global _enabled, _memory, _started_tracemalloc
+    if memory and not tracemalloc.is_tracing():
+        tracemalloc.start()
+        _started_tracemalloc = True
+    _memory = memory
+    _enabled = True
+
+
+def disable():
+    global _enabled, _memory, _started_tracemalloc
+    _enabled = False
+    _memory = False
+    if _started_tracemalloc:
+        tracemalloc.stop()
+        _started_tracemalloc = False
+
+
+def reset():
+    _stats.clear()
+    _folded.clear()
+
+
+@contextmanager
+def profile(memory=False):
+    ''' Record a fresh profile of the enclosed block'''
+    reset()
+    enable(memory)
+    try:
+        yield
+    finally:
+        disable()
+
+
+def report():
+    ''' {phase: statistics} of everything recorded since the last reset, in seconds'''
+    phases = {}
+    for name, stats in _stats.items():
+        times = np.array(stats.times)
+        p50, p90, p99 = np.percentile(times, [50, 90, 99])
+        phases[name] = dict(
+            calls=len(times),
+            total_s=times.sum(),
+            self_s=stats.self_time,
+            mean_s=times.mean(),
+            p50_s=p50,
+            p90_s=p90,
+            p99_s=p99,
+            max_s=times.max(),
+            alloc_blocks=stats.blocks,
+        )
+        if stats.bytes is not None:
+            phases[name]["alloc_bytes"] = stats.bytes
+    return phases
+
+
+def write_json(path):
+    with open(path, "w") as f:
+        json.dump(report(), f, indent=2, default=float)
+
+
+def write_collapsed(path):
+    ''' Self time of every phase stack in microseconds, one "a;b;c count" line
+    each, the folded format read by flamegraph.pl and speedscope'''
+    with open(path, "w") as f:
+        for stack, seconds in sorted(_folded.items()):
+            f.write(f"{stack} {round(seconds * 1e6)}\n")
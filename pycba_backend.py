@@ -0,0 +1,50 @@
+''' The pycba solver backend of BeamModel, in its own module because importing
+pycba also imports matplotlib, which is slow for short headless runs'''
+import numpy as np
+import pycba as cba
+from scipy import linalg
+
+from profiling import phase
+
+
+def _rows(LM):
+    # pycba only takes a load matrix as a list of lists
+    return LM.tolist() if isinstance(LM, np.ndarray) else LM
+
+
+class FactoredBeamAnalysis(cba.BeamAnalysis):
+    ''' BeamAnalysis that keeps its assembled stiffness and Cholesky factor until
+    the beam structure changes, so a new load matrix costs a back-substitution.
+    solves counts the load cases solved by every instance.'''
+    solves = 0
+
+    def __init__(self, L, EI, R, LM=None, **kwargs):
+        super().__init__(L, EI, R, _rows(LM), **kwargs)
+        self._ksys_version = None
+        self._ksys = None
+        self._factor_version = None
+        self._factor = None
+
+    def set_loads(self, LM):
+        super().set_loads(_rows(LM))
+
+    def _assemble(self):
+        if self._ksys_version != self._beam.structure_version:
+            self._ksys = super()._assemble()
+            self._ksys_version = self._beam.structure_version
+        return self._ksys
+
+    def _solver(self, A, b):
+        # A only depends on the structure and restraints, never on the loads
+        if self._factor_version != self._beam.structure_version:
+            try:
+                self._factor = linalg.cho_factor(A)
+            except linalg.LinAlgError as exc:
+                raise ValueError(
+                    "Structure is geometrically unstable: the stiffness matrix is "
+                    "singular. Check that sufficient support restraints are defined."
+                ) from exc
+            self._factor_version = self._beam.structure_version
+        FactoredBeamAnalysis.solves += 1
+        with phase("solve"):
+            return linalg.cho_solve(self._factor, b)
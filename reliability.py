@@ -0,0 +1,126 @@
+''' Monte Carlo reliability of a design against the train load.
+
+Strengths, E, mu and section dimensions are sampled around their values in
+the design parameters and every failure mode of station_fos.mode_fos is
+checked for every sample in vectorized chunks. The load effects come from
+one unit-load train envelope: every stress is linear in the car1 load, so a
+sample's failure load in a mode is its FoS at unit load.
+
+Each sampled quantity gets one factor per sample, shared by every segment,
+so the stiffness ratios between segments and with them the envelope do not
+change from sample to sample.'''
+import numpy as np
+
+from combination import BUCKLING_MODES, MATERIAL_MODES, build_beam, station_envelope
+from profiling import profiled
+from station_fos import mode_fos, segment_extremes, station_sections
+
+
+# (distribution, coefficient of variation) of each sampled parameter, about
+# its value in the design parameters
+VARIABILITY = {
+    "strength_tension": ("lognormal", 0.15),
+    "strength_compression": ("lognormal", 0.15),
+    "strength_shear": ("lognormal", 0.15),
+    "strength_glue": ("lognormal", 0.25),
+    "E": ("lognormal", 0.10),
+    "mu": ("normal", 0.05),
+    "I": ("normal", 0.05),
+    "t1": ("normal", 0.05), "t2": ("normal", 0.05), "t3": ("normal", 0.05), "t4": ("normal", 0.05),
+    "b1": ("normal", 0.02), "b2": ("normal", 0.02), "b3": ("normal", 0.02),
+}
+
+
+def sample_factors(rng, distribution, cov, n):
+    ''' n multiplicative factors with mean 1 and the given coefficient of variation'''
+    if distribution == "lognormal":
+        sigma2 = np.log1p(cov**2)
+        return rng.lognormal(-sigma2 / 2, np.sqrt(sigma2), n)
+    if distribution == "normal":
+        # a negative strength or thickness is meaningless, so the far tail is cut
+        return np.maximum(rng.normal(1., cov, n), 1e-6)
+    raise ValueError(f"Unknown distribution {distribution!r}, use 'normal' or 'lognormal'.")
+
+
+class ReliabilityResult:
+    ''' Failure loads (car1 load at failure) of every sample in every mode'''
+    def __init__(self, load, failure_loads):
+        self.load = load
+        self.failure_loads = failure_loads
+        modes = list(failure_loads)
+        table = np.vstack([failure_loads[mode] for mode in modes])
+        governing = table.argmin(axis=0)
+        self.system = table[governing, np.arange(table.shape[1])]
+        self.governing = {mode: np.mean(governing == i) for i, mode in enumerate(modes)}
+
+    @property
+    def n_samples(self):
+        return len(self.system)
+
+    def probability(self, load=None):
+        ''' Probability of failure at the car1 load in each mode and in any mode ("system")'''
+        load = self.load if load is None else load
+        p = {mode: np.mean(loads < load) for mode, loads in self.failure_loads.items()}
+        p["system"] = np.mean(self.system < load)
+        return p
+
+    def quantiles(self, q=(0.001, 0.01, 0.05, 0.5)):
+        ''' Failure-load quantiles of each mode and of the system'''
+        q = np.asarray(q)
+        out = {mode: np.quantile(loads, q) for mode, loads in self.failure_loads.items()}
+        out["system"] = np.quantile(self.system, q)
+        return out
+
+    def histogram(self, mode="system", bins=100):
+        ''' (counts, bin edges) of the failure load in a mode or the system'''
+        loads = self.system if mode == "system" else self.failure_loads[mode]
+        return np.histogram(loads[np.isfinite(loads)], bins=bins)
+
+    def summary(self):
+        return dict(
+            load=self.load,
+            n_samples=self.n_samples,
+            probability=self.probability(),
+            quantiles=self.quantiles(),
+            governing_share=self.governing,
+        )
+
+
+@profiled
+def monte_carlo(params, load=100., n_samples=10**6, variability=VARIABILITY, beam=None,
+                seed=None, chunk=2**16):
+    ''' Failure loads of n_samples random variations of the design, and the
+    failure probabilities at the given car1 load. Parameters missing from
+    params are not sampled.'''
+    if beam is None:
+        beam = build_beam(params)
+    if not beam.linear or beam.has_static_loads():
+        raise ValueError("Monte Carlo needs a linear beam without static loads.")
+    beam.analyze_train(1.)
+    # the worst station of each segment governs it whatever the sample
+    Mmax, Mmin, Vmax, Vmin = segment_extremes(params, station_envelope(beam))[0]
+
+    n = len(params["L"])
+    segments = np.arange(n)
+    base = dict(params)
+    base.update(station_sections(params, segments))
+    section_keys = list(station_sections(params, segments))
+    sampled = {key: spec for key, spec in variability.items() if key in base}
+
+    rng = np.random.default_rng(seed)
+    failure_loads = {}
+    for start in range(0, n_samples, chunk):
+        size = min(chunk, n_samples - start)
+        sample = dict(base)
+        for key, (distribution, cov) in sampled.items():
+            factors = sample_factors(rng, distribution, cov, size)[:, None]
+            sample[key] = np.asarray(base[key], dtype=float) * factors
+        sections = {key: sample[key] for key in section_keys}
+        # FoS at unit load is the failure load
+        fos = mode_fos(Mmax, Mmin, Vmax, Vmin, sections, sample)
+        for mode, values in fos.items():
+            values = np.broadcast_to(values, (size, n)).min(axis=1)
+            failure_loads.setdefault(mode, np.empty(n_samples))[start:start + size] = values
+
+    order = [mode for mode in MATERIAL_MODES + BUCKLING_MODES if mode in failure_loads]
+    return ReliabilityResult(load, {mode: failure_loads[mode] for mode in order})
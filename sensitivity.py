@@ -0,0 +1,232 @@
+''' Analytic gradients of each failure mode's factor of safety.
+
+The FoS of a mode is the smallest capacity / stress over the segments (the
+station checks of station_fos, reduced to the worst station of each
+segment), so its gradient is that of the governing segment:
+
+    dFoS = FoS * (dcapacity / capacity - dstress / stress)
+
+with the stress and buckling formulas differentiated by hand. The stresses
+also depend on the envelope, whose peak at the governing station comes
+from one train position. Its change with the EI of each segment is that of
+a single load case, found by direct differentiation of the banded solve
+(BandedBeamAnalysis.ei_sensitivities); on beams supported only at the ends
+it is zero. Moving a segment boundary changes which stations a segment
+checks, which matters when its worst station is on the boundary; the
+envelope itself is held fixed for that term. That is only exact on beams
+supported only at the ends: where the boundaries are supports, moving them
+changes the envelope too, so the boundary and split gradients are NaN.'''
+import math
+
+import numpy as np
+
+from banded import BandedBeamAnalysis, statically_determinate
+from combination import BUCKLING_MODES, MATERIAL_MODES, build_beam, station_envelope
+from profiling import profiled
+from station_fos import segment_extremes, station_sections
+
+
+EFFECTS = ("Mmax", "Mmin", "Vmax", "Vmin")
+
+# buckling coefficient, thickness, width and distance from the centroid of each plate
+PLATES = {
+    "flange buckling": (4, "t1", "b1", "y_flange"),
+    "tips buckling": (0.425, "t2", "b2", "y_tips"),
+    "web buckling": (6, "t3", "b3", "y_web"),
+}
+
+# columns of params["y_plate"]
+Y_PLATE = ("y_flange", "y_tips", "y_web")
+
+
+def _mode_terms(mode, sec, dem, params):
+    ''' (stress, {variable: dstress}, capacity, {variable: dcapacity}) of a
+    mode with segment section values sec and demands dem'''
+    I, y, h = sec["I"], sec["ybar"], sec["height"]
+    Mmax, Mmin = dem["Mmax"], dem["Mmin"]
+
+    if mode in ("tension", "compression"):
+        # the same sides as combination.mode_checks
+        sag, hog = (y, h - y) if mode == "tension" else (h - y, y)
+        if Mmax * sag >= -Mmin * hog:
+            stress = Mmax * sag / I
+            d = {"Mmax": sag / I, "I": -stress / I}
+            d["ybar"] = Mmax / I if mode == "tension" else -Mmax / I
+            if mode == "compression":
+                d["height"] = Mmax / I
+        else:
+            stress = -Mmin * hog / I
+            d = {"Mmin": -hog / I, "I": -stress / I}
+            d["ybar"] = Mmin / I if mode == "tension" else -Mmin / I
+            if mode == "tension":
+                d["height"] = -Mmin / I
+        strength = "strength_" + mode
+        return stress, d, params[strength], {strength: 1.}
+
+    if mode in ("shear", "glue", "shear buckling"):
+        Q, B = {"shear": ("Q", "B"), "glue": ("Q_glue", "B_glue"),
+                "shear buckling": ("Q_Flexural_Stress_Buckling", "B_Flexural_Stress_Buckling")}[mode]
+        V, effect, sign = ((dem["Vmax"], "Vmax", 1.) if dem["Vmax"] >= -dem["Vmin"]
+                           else (-dem["Vmin"], "Vmin", -1.))
+        stress = V * sec[Q] / (I * sec[B])
+        d = {effect: sign * sec[Q] / (I * sec[B]), Q: stress / sec[Q], "I": -stress / I,
+             B: -stress / sec[B]}
+        if mode != "shear buckling":
+            strength = "strength_shear" if mode == "shear" else "strength_glue"
+            return stress, d, params[strength], {strength: 1.}
+        t, hw, a = sec["t4"], sec["h4"], sec["a"]
+        unit = 5 * math.pi**2 * params["E"] / (12 * (1 - params["mu"]**2))
+        capacity = unit * ((t / hw)**2 + (t / a)**2)
+        dcap = {"t4": 2 * unit * t * (1 / hw**2 + 1 / a**2), "h4": -2 * unit * t**2 / hw**3,
+                "a": -2 * unit * t**2 / a**3}
+        return stress, d, capacity, _material_terms(capacity, dcap, params)
+
+    C, t, b, y_name = PLATES[mode]
+    stress = Mmax * sec[y_name] / I
+    d = {"Mmax": sec[y_name] / I, y_name: Mmax / I, "I": -stress / I}
+    capacity = C * math.pi**2 * params["E"] / (12 * (1 - params["mu"]**2)) * (sec[t] / sec[b])**2
+    dcap = {t: 2 * capacity / sec[t], b: -2 * capacity / sec[b]}
+    return stress, d, capacity, _material_terms(capacity, dcap, params)
+
+
+def _material_terms(capacity, dcap, params):
+    # plate buckling capacities are proportional to E / (1 - mu^2)
+    mu = params["mu"]
+    dcap["E"] = capacity / params["E"]
+    dcap["mu"] = capacity * 2 * mu / (1 - mu**2)
+    return dcap
+
+
+def _entry(values, n, k):
+    ''' Index into a parameter of the value segment k uses (see combination.segment_values)'''
+    values = np.asarray(values)
+    if values.ndim == 0:
+        return ()
+    if len(values) == n:
+        return (k,)
+    if len(values) == 1:
+        return (0,)
+    return (0 if k in (0, n - 1) else 1,)
+
+
+class _EnvelopeSensitivity:
+    ''' Changes of the envelope peaks with EI and the segment boundaries'''
+    def __init__(self, beam, params, load, stations):
+        self.beam = beam
+        self.env = beam.bridge_env
+        self.stations = stations
+        self.boundaries = np.cumsum(params["L"])[:-1]
+        self.train = beam.create_train(load)
+        # the banded backend's factorization is shared with the beam's
+        self.ba = (beam._beam_analysis(beam.LM) if beam.backend == "banded"
+                   else BandedBeamAnalysis(beam.L, beam.EI, beam.R))
+
+        # unit-load influence lines at every station, cached on the beam
+        self.positions, _, self.M_il, self.V_il, _ = beam.influence_lines(beam.step)
+        self.fronts = np.arange(round((self.ba.length + self.train.L) / beam.step) + 1) * beam.step
+        self._solved = {}
+
+    def _case(self, front):
+        ''' dM/dEI and dV/dEI with the front axle at front'''
+        if front not in self._solved:
+            span, at = self.ba.locate(front - self.train.axle_coords)
+            *_, D = self.ba.solve_point_loads(self.train.axw[:, None], span[:, None], at[:, None],
+                                              self.beam.n_points)
+            self._solved[front] = self.ba.ei_sensitivities(D[:, 0], self.beam.n_points)
+        return self._solved[front]
+
+    def ei(self, effect, k):
+        ''' d(effect peak of segment k)/d(EI of every member)'''
+        s = self.stations[EFFECTS.index(effect), k]
+        lines = self.M_il if effect[0] == "M" else self.V_il
+        history = sum(w * np.interp(self.fronts - x, self.positions, lines[s], left=0., right=0.)
+                      for w, x in zip(self.train.axw, self.train.axle_coords))
+        front = self.fronts[np.argmax(history) if effect.endswith("max") else np.argmin(history)]
+        dM, dV = self._case(front)
+        return (dM if effect[0] == "M" else dV)[s]
+
+    def boundary(self, effect, k):
+        ''' d(effect peak of segment k)/d(position of every segment boundary)'''
+        s = self.stations[EFFECTS.index(effect), k]
+        x = self.env.x
+        values = getattr(self.env, effect)
+        grad = np.zeros(len(self.boundaries))
+        for i, b in enumerate(self.boundaries):
+            if not np.isclose(x[s], b) or i not in (k - 1, k):
+                continue
+            # the peak sits on the boundary because the envelope rises towards
+            # it, so it follows the envelope as the boundary moves either way
+            left = np.flatnonzero(x < b - 1e-9)[-1]
+            right = np.flatnonzero(x > b + 1e-9)[0]
+            slope = (values[right] - values[left]) / (x[right] - x[left])
+            grad[i] = slope
+        return grad
+
+
+@profiled
+def fos_gradients(params, beam=None, load=100., modes=MATERIAL_MODES + BUCKLING_MODES):
+    ''' {mode: (FoS, governing segment, {parameter: dFoS/dparameter})} at the
+    car1 load. Gradients have the shape of the parameter (y_plate included);
+    "boundaries" holds the derivatives by the position of each segment
+    boundary and, for three segments, "split" the derivative by the
+    symmetric support-span length of sweep.split_spans. Both are NaN on a
+    beam with interior supports, whose envelope moves with them.'''
+    if beam is None:
+        beam = build_beam(params)
+    if beam.has_static_loads():
+        raise ValueError("Sensitivities need a beam without static loads.")
+    beam.analyze_train(load)
+    demands, stations = segment_extremes(params, station_envelope(beam))
+    envelope = _EnvelopeSensitivity(beam, params, load, stations)
+
+    n = len(params["L"])
+    sections = station_sections(params, np.arange(n))
+    I_segments = np.broadcast_to(np.asarray(beam.EI, dtype=float) / params["E"], (n,))
+
+    results = {}
+    for mode in modes:
+        if mode in BUCKLING_MODES and "t1" not in params:
+            continue
+        found = []
+        for k in range(n):
+            sec = {key: value[k] for key, value in sections.items()}
+            dem = dict(zip(EFFECTS, demands[:, k]))
+            stress, dstress, capacity, dcap = _mode_terms(mode, sec, dem, params)
+            fos = capacity / stress if stress > 0 else math.inf
+            found.append((fos, k, stress, dstress, capacity, dcap))
+        fos, k, stress, dstress, capacity, dcap = min(found, key=lambda item: item[0])
+
+        grad = {}
+        boundaries = np.zeros(n - 1)
+        if math.isfinite(fos):
+            dfos = {var: fos * value / capacity for var, value in dcap.items()}
+            for var, value in dstress.items():
+                dfos[var] = dfos.get(var, 0.) - fos * value / stress
+            for var, value in dfos.items():
+                if var in EFFECTS:
+                    # chain through EI = E * I of every segment and the boundaries
+                    dEI = value * envelope.ei(var, k)
+                    for j in range(n):
+                        _add(grad, params, "I", _entry(params["I"], n, j), dEI[j] * params["E"])
+                    _add(grad, params, "E", (), dEI @ I_segments)
+                    boundaries += value * envelope.boundary(var, k)
+                elif var in Y_PLATE:
+                    column = Y_PLATE.index(var)
+                    row = _entry(np.asarray(params["y_plate"])[:, column], n, k)
+                    _add(grad, params, "y_plate", row + (column,), value)
+                else:
+                    _add(grad, params, var, _entry(params[var], n, k), value)
+        if not statically_determinate(beam.R):
+            boundaries[:] = np.nan
+        grad["boundaries"] = boundaries
+        if n == 3:
+            # L = [split, total - 2 split, split] moves the two boundaries apart
+            grad["split"] = boundaries[0] - boundaries[1]
+        results[mode] = (fos, k, grad)
+    return results
+
+
+def _add(grad, params, key, index, value):
+    if key not in grad:
+        grad[key] = np.zeros(np.shape(params[key]))
+    grad[key][index] += value
@@ -0,0 +1,48 @@
+import numpy as np
+
+from beam_functions import span_extremes
+from combination import (MATERIAL_MODES, BUCKLING_MODES, build_beam, mode_fos,
+                         station_envelope, station_sections)
+from profiling import profiled
+
+
+@profiled
+def fos_kernel(x, Mmax, Mmin, Vmax, Vmin, sections, params):
+    ''' Factor of safety of every failure mode at every station in one pass.
+    sections holds per-station arrays (see station_sections). Returns
+    ({mode: FoS array}, (governing FoS, mode, x))'''
+    fos = mode_fos(Mmax, Mmin, Vmax, Vmin, sections, params)
+    modes = [mode for mode in MATERIAL_MODES + BUCKLING_MODES if mode in fos]
+    table = np.vstack([fos[mode] for mode in modes])
+    i_mode, i_station = np.unravel_index(np.argmin(table), table.shape)
+    return fos, (table[i_mode, i_station], modes[i_mode], x[i_station])
+
+
+def segment_extremes(params, env):
+    ''' Largest Mmax and Vmax and smallest Mmin and Vmin of each segment as
+    (values, stations), both shaped (4, segments) in that order, stations
+    being indices into env.x. The section is constant along a segment, so
+    these stations govern it; stations on a boundary count for both sides.'''
+    return span_extremes(env, np.cumsum(params["L"])[:-1])
+
+
+def envelope_fos(params, env):
+    ''' fos_kernel over a train envelope. Stations on a segment boundary are
+    checked with the sections on both sides.'''
+    boundaries = np.cumsum(params["L"])[:-1]
+    results = [fos_kernel(env.x, env.Mmax, env.Mmin, env.Vmax, env.Vmin,
+                          station_sections(params, np.searchsorted(boundaries, env.x, side=side)),
+                          params)
+               for side in ("left", "right")]
+
+    fos = {mode: np.minimum(results[0][0][mode], results[1][0][mode]) for mode in results[0][0]}
+    return fos, min(results[0][1], results[1][1], key=lambda governing: governing[0])
+
+
+@profiled
+def analyze_fos_stations(params, beam=None, load=100):
+    ''' Run the train at the given car1 load and check every station'''
+    if beam is None:
+        beam = build_beam(params)
+    beam.analyze_train(load)
+    return envelope_fos(params, station_envelope(beam))
@@ -0,0 +1,165 @@
+import copy
+import itertools
+import math
+import os
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import contextmanager
+
+import numpy as np
+
+from combination import (MATERIAL_MODES, analyze_fos_nonuniform, build_beam, fos_report,
+                         segment_values, update_beam)
+from envelope_cache import EnvelopeCache
+from sweep_output import open_writer
+
+
+TOTAL_LENGTH = 1200
+
+
+def split_spans(split, total=TOTAL_LENGTH):
+    ''' Symmetric [support span, central span, support span] for a support-span length'''
+    return [split, total - 2 * split, split]
+
+
+def apply_overrides(params, overrides):
+    ''' Copy of params with overrides applied. Keys are parameter names,
+    "name[i]" for one entry of a per-segment list, or "split" for the span split'''
+    design = copy.deepcopy(params)
+    for key, value in overrides.items():
+        if key == "split":
+            design["L"] = split_spans(value)
+        elif key.endswith("]"):
+            name, index = key[:-1].split("[")
+            design[name][int(index)] = value
+        else:
+            design[key] = value
+    return design
+
+
+def is_feasible(design):
+    ''' Cheap geometric checks that reject a design before any analysis'''
+    n = len(design["L"])
+    if any(length <= 0 for length in design["L"]):
+        return False
+    # uniform designs give one value for every segment
+    I, y, h = (segment_values(design[key], n) for key in ("I", "ybar", "height"))
+    if np.any(I <= 0) or not np.all((0 < y) & (y < h)):
+        return False
+    # plates must be thinner than they are wide
+    for t, b in (("t1", "b1"), ("t2", "b2"), ("t3", "b3"), ("t4", "h4"), ("t4", "a")):
+        if t in design:
+            t, b = segment_values(design[t], n), segment_values(design[b], n)
+            if not np.all((0 < t) & (t < b)):
+                return False
+    return True
+
+
+# The base parameters are sent once per worker instead of once per design
+_base_params = None
+_modes = MATERIAL_MODES
+_cache = None
+_beam = None
+
+
+def _init_worker(params, modes=MATERIAL_MODES, cache_dir=None):
+    global _base_params, _modes, _cache, _beam
+    _base_params = params
+    _modes = modes
+    _cache = EnvelopeCache(cache_dir) if cache_dir else None
+    _beam = None
+
+
+def _design_beam(design):
+    ''' The worker's beam updated in place to the design when it only changes
+    EI or the split of the last design's, else a new one (see update_beam)'''
+    global _beam
+    if _beam is None or not update_beam(_beam, design):
+        _beam = build_beam(design, cache=_cache)
+    return _beam
+
+
+def _evaluate(overrides):
+    design = apply_overrides(_base_params, overrides)
+    if not is_feasible(design):
+        return overrides, -math.inf
+    return overrides, analyze_fos_nonuniform(design, _modes, _cache, _design_beam(design))
+
+
+def _evaluate_record(overrides):
+    design = apply_overrides(_base_params, overrides)
+    if not is_feasible(design):
+        # JSON has no infinity, so an infeasible design has no min_fos
+        return dict(design=overrides, fos={}, at={}, mode=None, min_fos=None,
+                    failure_load=None)
+    return dict(design=overrides, **fos_report(design, _modes, _cache, beam=_design_beam(design)))
+
+
+@contextmanager
+def evaluation_map(params, processes=None, modes=MATERIAL_MODES, chunksize=None, cache_dir=None,
+                   evaluate=_evaluate):
+    ''' Yields map(list of overrides) -> [evaluate(overrides), ...], by default
+    [(overrides, fos), ...], run across a process pool or in this process when
+    processes == 1. With cache_dir the workers share an on-disk envelope cache.'''
+    processes = processes or os.cpu_count()
+    if processes == 1:
+        _init_worker(params, modes, cache_dir)
+        yield lambda designs: [evaluate(design) for design in designs]
+        return
+
+    with ProcessPoolExecutor(processes, initializer=_init_worker, initargs=(params, modes, cache_dir)) as pool:
+        def evaluate_all(designs):
+            # a few chunks per worker balances the load without much pickling
+            size = chunksize or max(1, math.ceil(len(designs) / (4 * processes)))
+            return list(pool.map(evaluate, designs, chunksize=size))
+        yield evaluate_all
+
+
+def sweep(params, grid, processes=None, chunksize=None, modes=MATERIAL_MODES, cache_dir=None):
+    ''' Minimum FoS from analyze_fos_nonuniform for every combination of the
+    values in grid, e.g. {"split": range(10, 400), "I[1]": [629372, 700000]}.
+    Returns [(overrides, fos), ...] sorted from the best design down'''
+    names = list(grid)
+    designs = [dict(zip(names, values)) for values in itertools.product(*grid.values())]
+
+    with evaluation_map(params, processes, modes, chunksize, cache_dir) as evaluate_all:
+        rows = evaluate_all(designs)
+
+    rows.sort(key=lambda row: row[1], reverse=True)
+    return rows
+
+
+def iter_designs(grid, start=0):
+    ''' Overrides of every combination of the values in grid, in a fixed
+    order, from the start-th on'''
+    names = list(grid)
+    for values in itertools.islice(itertools.product(*grid.values()), start, None):
+        yield dict(zip(names, values))
+
+
+def iter_sweep(params, grid, processes=None, modes=MATERIAL_MODES, cache_dir=None, start=0,
+               batch_size=None):
+    ''' Yields a record (see sweep_output) for every design of grid in the
+    order of iter_designs. Designs go to the pool in batches, so memory does
+    not grow with the size of the grid.'''
+    designs = iter_designs(grid, start)
+    batch_size = batch_size or 64 * (processes or os.cpu_count())
+    with evaluation_map(params, processes, modes, cache_dir=cache_dir,
+                        evaluate=_evaluate_record) as evaluate_all:
+        while True:
+            batch = list(itertools.islice(designs, batch_size))
+            if not batch:
+                return
+            yield from evaluate_all(batch)
+
+
+def stream_sweep(params, grid, path, processes=None, modes=MATERIAL_MODES, cache_dir=None,
+                 chunk_rows=10000):
+    ''' iter_sweep with every record written to path (a .jsonl file or a
+    directory of columnar chunks) as it is evaluated, yielding the records it
+    writes. Records already in path are kept and their designs skipped, so
+    calling it again after a crash resumes the run.'''
+    with open_writer(path, chunk_rows) as writer:
+        done = sum(1 for _ in writer.recover())
+        for record in iter_sweep(params, grid, processes, modes, cache_dir, start=done):
+            writer.write(record)
+            yield record
@@ -0,0 +1,174 @@
+''' Sweep records written as they are evaluated, so a sweep of any size runs
+in constant memory and a crashed run can pick up after its last record.
+
+A record is a dict with the design overrides, the FoS and location of each
+failure mode, the governing mode, its FoS and the failure load:
+
+    {"design": {"split": 150}, "fos": {"tension": 3.8, ...},
+     "at": {"tension": "span 2", ...}, "mode": "compression",
+     "min_fos": 2.78, "failure_load": 278.4}
+
+A design that fails sweep.is_feasible has empty fos and at and a null
+mode, min_fos and failure_load.
+
+Paths ending in .jsonl hold one record per line; any other path is a
+directory of columnar .npz chunks, one array per flattened field
+("design.split", "fos.tension", ...).'''
+import glob
+import json
+import os
+
+import numpy as np
+
+
+# flattened fields that hold text; every other field is a float column
+TEXT_FIELDS = ("at.", "mode")
+
+
+def flatten(record):
+    ''' {"design.split": 150, "fos.tension": 3.8, ...} of a record'''
+    flat = {}
+    for key, value in record.items():
+        if isinstance(value, dict):
+            for name, item in value.items():
+                flat[f"{key}.{name}"] = item
+        else:
+            flat[key] = value
+    return flat
+
+
+def unflatten(flat):
+    record = {}
+    for key, value in flat.items():
+        group, dot, name = key.partition(".")
+        if dot:
+            record.setdefault(group, {})[name] = value
+        else:
+            record[key] = value
+    return record
+
+
+def _is_text(field):
+    return field.startswith(TEXT_FIELDS)
+
+
+class JsonlWriter:
+    ''' Records appended to a JSON Lines file, one flushed line each'''
+    def __init__(self, path):
+        self.path = path
+        self._file = None
+
+    def recover(self):
+        ''' Yield the records already in the file, after cutting off a last
+        line that a crash left incomplete'''
+        if not os.path.exists(self.path):
+            return
+        complete = 0
+        with open(self.path, "rb") as f:
+            for line in f:
+                if not line.endswith(b"\n"):
+                    break
+                try:
+                    json.loads(line)
+                except ValueError:
+                    break
+                complete += len(line)
+        os.truncate(self.path, complete)
+        yield from read_records(self.path)
+
+    def write(self, record):
+        if self._file is None:
+            self._file = open(self.path, "a")
+        self._file.write(json.dumps(record, default=float) + "\n")
+        self._file.flush()
+
+    def close(self):
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+class ColumnarWriter:
+    ''' Records buffered into columns and saved every chunk_rows records as a
+    numbered .npz chunk in directory. Chunks are written under a temporary
+    name and renamed, so a crash loses at most the buffered records.'''
+    def __init__(self, directory, chunk_rows=10000):
+        self.directory = directory
+        self.chunk_rows = chunk_rows
+        self._rows = []
+        os.makedirs(directory, exist_ok=True)
+        self._next = len(self._chunks())
+
+    def _chunks(self):
+        return sorted(glob.glob(os.path.join(self.directory, "chunk-*.npz")))
+
+    def recover(self):
+        ''' Yield the records in the chunks already written'''
+        yield from read_records(self.directory)
+
+    def write(self, record):
+        self._rows.append(flatten(record))
+        if len(self._rows) >= self.chunk_rows:
+            self.flush()
+
+    def flush(self):
+        if not self._rows:
+            return
+        fields = list(dict.fromkeys(field for row in self._rows for field in row))
+        columns = {}
+        for field in fields:
+            values = [row.get(field) for row in self._rows]
+            if _is_text(field):
+                columns[field] = np.array(["" if v is None else str(v) for v in values])
+            else:
+                columns[field] = np.array([np.nan if v is None else v for v in values], dtype=float)
+        path = os.path.join(self.directory, f"chunk-{self._next:06d}.npz")
+        tmp = f"{path}.{os.getpid()}.tmp"
+        with open(tmp, "wb") as f:
+            np.savez(f, **columns)
+        os.replace(tmp, path)
+        self._next += 1
+        self._rows = []
+
+    def close(self):
+        self.flush()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def open_writer(path, chunk_rows=10000):
+    ''' JsonlWriter for a .jsonl path, else a ColumnarWriter on the directory'''
+    if path.endswith(".jsonl"):
+        return JsonlWriter(path)
+    return ColumnarWriter(path, chunk_rows)
+
+
+def read_records(path):
+    ''' Yield the records of a .jsonl file or a chunk directory one at a time'''
+    if path.endswith(".jsonl"):
+        with open(path) as f:
+            for line in f:
+                yield json.loads(line)
+        return
+    for chunk in sorted(glob.glob(os.path.join(path, "chunk-*.npz"))):
+        with np.load(chunk, allow_pickle=False) as data:
+            columns = {field: data[field].tolist() for field in data.files}
+        n_rows = len(next(iter(columns.values()), []))
+        for i in range(n_rows):
+            flat = {}
+            for field, values in columns.items():
+                value = values[i]
+                if value == "" or (not _is_text(field) and np.isnan(value)):
+                    continue
+                flat[field] = value
+            yield unflatten(flat)
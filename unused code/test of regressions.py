@@ -0,0 +1,127 @@
+''' Regression checks, run from the repository root:
+
+    PYTHONPATH=. python "unused code/test of regressions.py"
+'''
+import json
+import math
+import os
+import tempfile
+
+import numpy as np
+
+from beam_functions import BeamModel
+from combination import (BUCKLING_MODES, MATERIAL_MODES, build_beam, fos_report,
+                         nonuniform_params, uniform_params)
+from cross_section import Section, with_sections
+from station_fos import analyze_fos_stations
+from sweep import stream_sweep, sweep
+from sweep_output import read_records
+
+
+# sweeps take uniform designs, whose section values are scalars, as well as nonuniform ones
+for base in (uniform_params, nonuniform_params):
+    rows = sweep(base, {"strength_glue": [1, 2]}, processes=1)
+    assert len(rows) == 2 and all(math.isfinite(fos) for _, fos in rows)
+
+# load cases from a catalog file can use the cars defined in it
+catalog = dict(cars={"tanker": [[200, 150], [0.7, 0.7, 0.7]]},
+               load_cases={"Tanker train": dict(cars=["locomotive", "tanker"], gaps=[164])})
+with tempfile.TemporaryDirectory() as folder:
+    path = os.path.join(folder, "catalog.json")
+    with open(path, "w") as f:
+        json.dump(catalog, f)
+    beam = build_beam(dict(uniform_params, backend="banded"))
+    beam.use_catalog(path)
+    assert beam.analyze_load_cases(100)["Mmax"]["case"] == "Tanker train"
+
+# the critical method's envelope is only complete at the global extremes
+try:
+    fos_report(dict(nonuniform_params, method="critical"))
+    raise AssertionError("station checks accepted a critical envelope")
+except ValueError:
+    pass
+
+# per-span maxima are the same on both backends, as pycba's member results give them
+span_max = {}
+for backend in ("pycba", "banded"):
+    beam = BeamModel(EI=1e9, backend=backend)
+    for length in (300, 500, 400):
+        beam.add_support(length, "roller")
+    beam.add_point_load(100, 150)
+    beam.add_point_load(50, 1000)
+    beam.analyze()
+    span_max[backend] = np.array(beam.get_span_max_moments(), dtype=float)
+    if backend == "pycba":
+        members = beam.beam_analysis.beam_results.vRes
+        reference = [(i, m.M.max(), m.x[m.M.argmax()]) for i, m in enumerate(members, 1)]
+        assert np.allclose(span_max["pycba"], reference)
+assert np.allclose(span_max["banded"], span_max["pycba"])
+
+# a section replaces the stiffness and every stress input, y_plate included
+box = Section([(80, 1.27, 0), (1.27, 72.46, 1.27), (1.27, 72.46, 1.27), (100, 2.54, 73.73)],
+              glue=(73.73, 10), buckling=(3, 3, 1))
+design = dict(nonuniform_params, backend="banded")
+sectioned = with_sections(design, [box] * 3)
+assert np.allclose(sectioned["y_plate"][:, 0], box.y_plate(3))
+modes = MATERIAL_MODES + BUCKLING_MODES
+assert (fos_report(design, modes, section=[box] * 3)
+        == fos_report(sectioned, modes, beam=build_beam(sectioned)))
+
+# infeasible designs are written as valid JSON, with a null min_fos
+with tempfile.TemporaryDirectory() as folder:
+    path = os.path.join(folder, "sweep.jsonl")
+    list(stream_sweep(uniform_params, {"ybar": [uniform_params["ybar"], -1]}, path, processes=1))
+    with open(path) as f:
+        for line in f:
+            json.dumps(json.loads(line), allow_nan=False)
+    assert [record["min_fos"] is None for record in read_records(path)] == [False, True]
+
+
+def continuous(L, EI, backend="banded", method="scan"):
+    beam = BeamModel(EI=EI, backend=backend)
+    for length in L:
+        beam.add_support(length, "roller")
+    beam.method = method
+    return beam
+
+
+def envelope(beam, load=100):
+    beam.analyze_train(load)
+    env = beam.bridge_env
+    return np.array([env.x, env.Mmax, env.Mmin, env.Vmax, env.Vmin])
+
+
+# single-span checks take the larger shear of either sign, as the station checks do
+report = fos_report(uniform_params)
+stations, _ = analyze_fos_stations(uniform_params)
+for mode in MATERIAL_MODES:
+    assert np.isclose(report["fos"][mode], stations[mode].min())
+
+# in-place EI changes and support moves (Woodbury corrections of the kept
+# cases and influence lines) match a beam built again
+for method, keep_cases in (("scan", True), ("scan", False), ("influence", False)):
+    beam = continuous([400, 500, 300], [2e9, 1e9, 3e9], method=method)
+    beam.keep_cases = keep_cases
+    envelope(beam)
+    beam.set_segment_ei(1, 1.5e9)
+    assert np.allclose(envelope(beam), envelope(continuous([400, 500, 300], [2e9, 1.5e9, 3e9],
+                                                           method=method)))
+    beam.set_span_lengths([350, 500, 350])
+    assert np.allclose(envelope(beam), envelope(continuous([350, 500, 350], [2e9, 1.5e9, 3e9],
+                                                           method=method)))
+
+# the banded backend matches pycba for static loads and for a train
+results = {}
+for backend in ("pycba", "banded"):
+    beam = continuous([400, 500, 300], [2e9, 1e9, 3e9], backend=backend)
+    beam.add_point_load(100, 150)
+    beam.add_udl(500, 0.2)
+    beam.analyze()
+    res = beam.beam_analysis.beam_results
+    results[backend] = [res.R, res.results.x, res.results.M, res.results.V]
+    beam.LM = np.zeros((1, 5))
+    results[backend].append(envelope(beam))
+for pycba_values, banded_values in zip(results["pycba"], results["banded"]):
+    assert np.allclose(banded_values, pycba_values, rtol=1e-6, atol=1e-6)
+
+print("all checks passed")
@@ -0,0 +1,89 @@
+import json
+
+import numpy as np
+
+
+# Cars as (axle spacings in mm, axle weights in units of car1_load), where
+# car1_load is the weight of the lightest freight car.
+CARS = {
+    "locomotive": ([176], [1.1 * 1.38 / 2] * 2),
+    "light car": ([176], [1 / 2] * 2),
+    "heavy car": ([176], [1.1 / 2] * 2),
+}
+
+# Load configurations: cars from the front of the train back, with the gaps
+# between them in mm. A car is a name from the car catalog or an inline
+# (axle spacings, axle weights) pair.
+LOAD_CASES = {
+    "Load Case 1": dict(cars=["light car"] * 3, gaps=[164, 164]),
+    "Load Case 2": dict(cars=["locomotive", "light car", "heavy car"], gaps=[164, 164]),
+}
+
+DEFAULT_LOAD_CASE = "Load Case 2"
+
+# Ways a train crosses the bridge: reversed runs it the other way (the axle
+# order flipped), count trains follow each other gap mm apart.
+SCENARIOS = {
+    "forward": dict(reverse=False, count=1),
+    "reversed": dict(reverse=True, count=1),
+    "two trains": dict(reverse=False, count=2, gap=164),
+}
+
+
+class Vehicle:
+    ''' Axles of a vehicle or train, with the attributes pycba's Vehicle has
+    (axs, axw, axle_coords, L, W, NoAxles), so BridgeAnalysis accepts it and
+    trains can be built without importing pycba'''
+    def __init__(self, axle_spacings, axle_weights):
+        self.axs = np.asarray(axle_spacings, dtype=float)
+        self.axw = np.asarray(axle_weights, dtype=float)
+        if len(self.axs) + 1 != len(self.axw):
+            raise ValueError("Inconsistent axle spacing and weight counts")
+        self.L = self.axs.sum()
+        self.W = self.axw.sum()
+        self.NoAxles = len(self.axw)
+        self.axle_coords = np.concatenate([[0.], np.cumsum(self.axs)])
+
+
+def make_train(vehicles, gaps):
+    ''' One Vehicle of vehicles following each other, gaps mm apart (a single
+    gap is used between every pair)'''
+    gaps = np.broadcast_to(np.asarray(gaps, dtype=float), (len(vehicles) - 1,))
+    spacings = list(vehicles[0].axs)
+    for gap, vehicle in zip(gaps, vehicles[1:]):
+        spacings += [gap, *vehicle.axs]
+    return Vehicle(spacings, np.concatenate([vehicle.axw for vehicle in vehicles]))
+
+
+def make_vehicle(config, car1_load, cars=CARS):
+    ''' Vehicle of a load configuration at the given car1 load'''
+    vehicles = []
+    for car in config["cars"]:
+        spacings, weights = cars[car] if isinstance(car, str) else car
+        vehicles.append(Vehicle(list(spacings), [w * car1_load for w in weights]))
+    if len(vehicles) == 1:
+        return vehicles[0]
+    return make_train(vehicles, list(config["gaps"]))
+
+
+def scenario_vehicle(vehicle, scenario):
+    ''' The vehicle as it runs in a scenario from SCENARIOS'''
+    spacings = np.diff(vehicle.axle_coords)
+    weights = np.asarray(vehicle.axw)
+    if scenario.get("reverse"):
+        spacings, weights = spacings[::-1], weights[::-1]
+    single = Vehicle(list(spacings), list(weights))
+    count = scenario.get("count", 1)
+    if count == 1:
+        return single
+    return make_train([single] * count, [scenario["gap"]])
+
+
+def load_catalog(path):
+    ''' (cars, load cases) from a JSON file with "cars" and "load_cases"
+    entries laid out like CARS and LOAD_CASES. Entries missing from the file
+    fall back to the built-in catalog.'''
+    with open(path) as f:
+        data = json.load(f)
+    cars = {**CARS, **{name: tuple(car) for name, car in data.get("cars", {}).items()}}
+    return cars, {**LOAD_CASES, **data.get("load_cases", {})}